@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+
+# Word by bit matrix of ROM data, stored by column
+# Copyright 2017 Eric Smith <spacewar@gmail.com>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the version 3 of the GNU General Public License
+# as published by the Free Software Foundation.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Bits of each byte value, least significant first, as bytes of 0 and 1.
+_unpack = [bytes((b >> i) & 1 for i in range(8)) for b in range(256)]
+
+_invert = bytes.maketrans(b'\x00\x01', b'\x01\x00')
+_binary = bytes.maketrans(b'\x00\x01', b'01')
+
+
+# Each bit is stored as a byte of value 0 or 1.  The matrix is decoded
+# once, and each column is kept as a contiguous bytes object, so a whole
+# column is read, compared or hashed at C speed.
+class BitMatrix:
+    def __init__(self, words, bits, cells):
+        if len(cells) != words * bits:
+            raise ValueError('%d cells, should be %d' % (len(cells), words * bits))
+        self.words = words
+        self.bits = bits
+        self.cells = cells  # row-major
+        self.columns = [cells[bit::bits] for bit in range(bits)]
+
+    # The bits of the file are numbered least significant bit of the first
+    # byte first, with word n occupying bits n * bits through
+    # (n + 1) * bits - 1.
+    @classmethod
+    def from_bytes(cls, data, words, bits):
+        return cls(words, bits, b''.join(map(_unpack.__getitem__, data)))
+
+    def get_bit(self, word, bit):
+        return self.cells[word * self.bits + bit]
+
+    def row(self, word):
+        return self.cells[word * self.bits : (word + 1) * self.bits]
+
+    def column(self, bit):
+        return self.columns[bit]
+
+    # The bits of a word as an integer, for Hamming distance computation.
+    def row_value(self, word):
+        return int(self.row(word).translate(_binary), 2)
+
+    # A new matrix with row n taken from row order[n] of this one,
+    # inverted if invert[n] is true.
+    def arrange(self, order, invert):
+        return BitMatrix(len(order), self.bits,
+                         b''.join(self.row(word).translate(_invert) if inv else self.row(word)
+                                  for word, inv in zip(order, invert)))
+
+    # Bit positions whose columns differ from those of another matrix.
+    def changed_columns(self, other):
+        return [bit for bit in range(self.bits) if self.columns[bit] != other.columns[bit]]
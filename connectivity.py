@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+
+# Connectivity check of the drive line and sense loop signals of a ROM board
+# Copyright 2017 Eric Smith <spacewar@gmail.com>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the version 3 of the GNU General Public License
+# as published by the Free Software Foundation.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import argparse
+import re
+import sys
+
+from eagle import EagleBoardFile
+
+
+# Coordinates are snapped to a grid of this size, in mm, so that points
+# which differ only by rounding are the same point.
+default_snap = 0.0001
+
+# Names of the signals pcb-rom.py generates, including those renamed
+# when merging into a template board.
+rom_signal_pattern = r'[WB]\d+(_\d+)?'
+
+
+class UnionFind:
+    def __init__(self):
+        self.parent = { }
+        self.size = { }
+
+    def find(self, p):
+        parent = self.parent
+        if p not in parent:
+            parent[p] = p
+            self.size[p] = 1
+            return p
+        while parent[p] != p:
+            parent[p] = parent[parent[p]]
+            p = parent[p]
+        return p
+
+    # Returns False if p and q were already connected.
+    def union(self, p, q):
+        p = self.find(p)
+        q = self.find(q)
+        if p == q:
+            return False
+        if self.size[p] < self.size[q]:
+            p, q = q, p
+        self.parent[q] = p
+        self.size[p] += self.size[q]
+        return True
+
+
+# Check that a signal is a single path of wires joining exactly two vias,
+# with no gaps, stubs, branches or loops.  Wires only connect at their
+# ends, and wires on different layers only connect through a via.
+# Duplicate and zero-length wires are ignored.  Returns a list of
+# descriptions of the problems found, which is empty if there are none.
+def check_signal(signal, snap = default_snap):
+    name = signal.get_name()
+
+    def point(x, y):
+        return (round(x / snap), round(y / snap))
+
+    def where(node):
+        p = node if node in vias else node[0]
+        return '(%.4f, %.4f)' % (p[0] * snap, p[1] * snap)
+
+    vias = { point(x, y): extent for x, y, drill, diameter, extent, shape in signal.vias() }
+
+    # A wire end is a node of its layer, except at a via, where the ends
+    # on all of the layers it spans are the same node.
+    def node(x, y, layer):
+        p = point(x, y)
+        extent = vias.get(p)
+        if extent is not None and extent[0] <= layer <= extent[1]:
+            return p
+        return (p, layer)
+
+    nodes = UnionFind()
+    degree = { }
+    seen = set()
+    loops = 0
+    for x1, y1, x2, y2, layer, width in signal.wires():
+        a = node(x1, y1, layer)
+        b = node(x2, y2, layer)
+        key = frozenset((a, b))
+        if a == b or key in seen:
+            continue
+        seen.add(key)
+        degree[a] = degree.get(a, 0) + 1
+        degree[b] = degree.get(b, 0) + 1
+        if not nodes.union(a, b):
+            loops += 1
+
+    problems = []
+    if len(vias) != 2:
+        problems.append('%s: %d vias, should be 2' % (name, len(vias)))
+    pieces = len({ nodes.find(n) for n in list(degree) + list(vias) })
+    if pieces > 1:
+        problems.append('%s: %d separate pieces' % (name, pieces))
+    if loops:
+        problems.append('%s: %d loops' % (name, loops))
+    for p in vias:
+        if degree.get(p, 0) != 1:
+            problems.append('%s: %d wires at via %s, should be 1' % (name, degree.get(p, 0), where(p)))
+    for n, d in degree.items():
+        if n in vias:
+            continue
+        if d == 1:
+            problems.append('%s: stub end at %s on layer %d' % (name, where(n), n[1]))
+        elif d > 2:
+            problems.append('%s: branch of %d wires at %s on layer %d' % (name, d, where(n), n[1]))
+    return problems
+
+
+# Check each of the signals whose names match pattern, returning a list
+# of the problems found.  signals may be those of a board, or those
+# generated by pcbrom.generate_signals().
+def check_signals(signals, pattern = rom_signal_pattern, snap = default_snap):
+    pattern = re.compile(pattern)
+    problems = []
+    for signal in signals:
+        if pattern.fullmatch(signal.get_name()):
+            problems += check_signal(signal, snap)
+    return problems
+
+
+def check_board(board, pattern = rom_signal_pattern, snap = default_snap):
+    return check_signals(board.board.signals.primitives, pattern, snap)
+
+
+def main():
+    parser = argparse.ArgumentParser(description = 'Check that each drive line and sense loop of ROM boards is a single path between two vias.')
+    parser.add_argument("board", help = "Eagle board file", nargs = '+')
+    parser.add_argument("--signals", help = "regular expression matching the names of the signals to check", default = rom_signal_pattern)
+    parser.add_argument("--snap", help = "grid in mm to which coordinates are snapped", type = float, default = default_snap)
+    args = parser.parse_args()
+
+    failures = 0
+    for path in args.board:
+        problems = check_board(EagleBoardFile.load(path, lean = True), args.signals, args.snap)
+        for problem in problems:
+            print('%s: %s' % (path, problem), file = sys.stderr)
+        if problems:
+            failures += 1
+    if failures:
+        print('%d of %d boards have connectivity problems' % (failures, len(args.board)), file = sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+
+# Design rule check of the clearances between the wires and vias of a board
+# Copyright 2017 Eric Smith <spacewar@gmail.com>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the version 3 of the GNU General Public License
+# as published by the Free Software Foundation.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import argparse
+import json
+import math
+import os
+import re
+import sys
+
+from eagle import EagleBoardFile, read_design_rules
+from length import Length
+
+
+default_rules = os.path.join(os.path.dirname(os.path.abspath(__file__)), '4layer6mil.dru')
+
+# Clearances less than the minimum by no more than this, in mm, are
+# rounding errors, since coordinates are written to six decimal places.
+tolerance = 0.000001
+
+WIRE = 0
+VIA = 1
+
+kind_names = { (WIRE, WIRE): 'wire-wire',
+               (WIRE, VIA):  'wire-via',
+               (VIA,  WIRE): 'wire-via',
+               (VIA,  VIA):  'via-via' }
+
+
+# The rules used from a design rules file, with lengths in mm.
+class DesignRules:
+    def __init__(self, rules):
+        def length(name):
+            if name not in rules:
+                raise ValueError('design rules have no %s' % name)
+            return Length(rules[name])
+
+        self.clearance = { (WIRE, WIRE): length('mdWireWire'),
+                           (WIRE, VIA):  length('mdWireVia'),
+                           (VIA,  WIRE): length('mdWireVia'),
+                           (VIA,  VIA):  length('mdViaVia') }
+        # Copper layers, e.g. "(1+2*15+16)" for layers 1, 2, 15 and 16.
+        self.layers = [int(layer) for layer in re.findall(r'\d+', rules.get('layerSetup', '(1*16)'))]
+        self.via_restring = { 'Outer': (float(rules['rvViaOuter']), length('rlMinViaOuter'), length('rlMaxViaOuter')),
+                              'Inner': (float(rules['rvViaInner']), length('rlMinViaInner'), length('rlMaxViaInner')) }
+
+    @classmethod
+    def read(cls, path):
+        return cls(read_design_rules(path))
+
+    # The copper diameter of a via on a layer: the drill plus twice the
+    # restring, which is a proportion of the drill limited to a range, or
+    # the via's own diameter if that is larger.
+    def via_diameter(self, drill, diameter, layer):
+        outer = layer in (self.layers[0], self.layers[-1])
+        ratio, low, high = self.via_restring['Outer' if outer else 'Inner']
+        d = drill + 2.0 * min(max(drill * ratio, low), high)
+        if diameter is not None and diameter > d:
+            return diameter
+        return d
+
+
+# The closest point to (px, py) on the segment from (x1, y1) to (x2, y2).
+def closest_point(px, py, x1, y1, x2, y2):
+    dx = x2 - x1
+    dy = y2 - y1
+    length2 = dx * dx + dy * dy
+    if length2 == 0.0:
+        return x1, y1
+    t = ((px - x1) * dx + (py - y1) * dy) / length2
+    t = min(max(t, 0.0), 1.0)
+    return x1 + t * dx, y1 + t * dy
+
+
+# The distance between two segments, and the closest points on each.
+def segment_distance(ax1, ay1, ax2, ay2, bx1, by1, bx2, by2):
+    # Segments that cross are at distance zero.
+    d1 = (bx2 - bx1) * (ay1 - by1) - (by2 - by1) * (ax1 - bx1)
+    d2 = (bx2 - bx1) * (ay2 - by1) - (by2 - by1) * (ax2 - bx1)
+    d3 = (ax2 - ax1) * (by1 - ay1) - (ay2 - ay1) * (bx1 - ax1)
+    d4 = (ax2 - ax1) * (by2 - ay1) - (ay2 - ay1) * (bx2 - ax1)
+    if d1 * d2 < 0.0 and d3 * d4 < 0.0:
+        t = d1 / (d1 - d2)
+        x = ax1 + t * (ax2 - ax1)
+        y = ay1 + t * (ay2 - ay1)
+        return 0.0, (x, y), (x, y)
+
+    best = None
+    for p, q in (((ax1, ay1), closest_point(ax1, ay1, bx1, by1, bx2, by2)),
+                 ((ax2, ay2), closest_point(ax2, ay2, bx1, by1, bx2, by2)),
+                 (closest_point(bx1, by1, ax1, ay1, ax2, ay2), (bx1, by1)),
+                 (closest_point(bx2, by2, ax1, ay1, ax2, ay2), (bx2, by2))):
+        d = math.hypot(p[0] - q[0], p[1] - q[1])
+        if best is None or d < best[0]:
+            best = (d, p, q)
+    return best
+
+
+# The copper of the signals on each layer, as lists of items
+# (kind, signal, x1, y1, x2, y2, radius, via), where a via is a segment
+# of zero length and via is the index of the via in the board, so that a
+# pair of vias is only reported once for all of the layers they share.
+def copper_items(board, rules):
+    layers = { layer: [] for layer in rules.layers }
+    via = 0
+    for signal in board.board.signals.primitives:
+        name = signal.get_name()
+        for x1, y1, x2, y2, layer, width in signal.wires():
+            if layer in layers:
+                layers[layer].append((WIRE, name, x1, y1, x2, y2, width / 2.0, None))
+        for x, y, drill, diameter, extent, shape in signal.vias():
+            for layer, items in layers.items():
+                if extent[0] <= layer <= extent[1]:
+                    items.append((VIA, name, x, y, x, y, rules.via_diameter(drill, diameter, layer) / 2.0, via))
+            via += 1
+    return layers
+
+
+# Check the clearances between the items of different signals on a layer,
+# appending violations to a list.  The items are bucketed into a uniform
+# grid of cells, by their bounding boxes grown by half of the largest
+# clearance, so that only items sharing a cell need be compared, and each
+# pair is only compared in the first cell they share.
+def check_layer(items, layer, rules, violations, reported_vias):
+    if not items:
+        return
+    margin = max(rules.clearance.values()) / 2.0
+    cell = 2.0 * (max(item[6] for item in items) + margin)
+
+    grid = { }
+    corners = []
+    for i, (kind, signal, x1, y1, x2, y2, radius, via) in enumerate(items):
+        grow = radius + margin
+        ix0 = math.floor((min(x1, x2) - grow) / cell)
+        iy0 = math.floor((min(y1, y2) - grow) / cell)
+        ix1 = math.floor((max(x1, x2) + grow) / cell)
+        iy1 = math.floor((max(y1, y2) + grow) / cell)
+        corners.append((ix0, iy0))
+        for ix in range(ix0, ix1 + 1):
+            for iy in range(iy0, iy1 + 1):
+                members = grid.get((ix, iy))
+                if members is None:
+                    grid[(ix, iy)] = [i]
+                else:
+                    members.append(i)
+
+    for (ix, iy), members in grid.items():
+        for m, i in enumerate(members):
+            a = items[i]
+            ax0, ay0 = corners[i]
+            for j in members[m+1:]:
+                b = items[j]
+                if a[1] == b[1]:
+                    continue
+                bx0, by0 = corners[j]
+                if (max(ax0, bx0), max(ay0, by0)) != (ix, iy):
+                    continue
+                required = rules.clearance[(a[0], b[0])]
+                distance, p, q = segment_distance(a[2], a[3], a[4], a[5], b[2], b[3], b[4], b[5])
+                gap = distance - a[6] - b[6]
+                if gap >= required - tolerance:
+                    continue
+                if a[0] == VIA and b[0] == VIA:
+                    pair = (min(a[7], b[7]), max(a[7], b[7]))
+                    if pair in reported_vias:
+                        continue
+                    reported_vias.add(pair)
+                violations.append({ 'type':      kind_names[(a[0], b[0])],
+                                    'layer':     layer,
+                                    'signals':   [a[1], b[1]],
+                                    'x':         round((p[0] + q[0]) / 2.0, 6),
+                                    'y':         round((p[1] + q[1]) / 2.0, 6),
+                                    'clearance': round(gap, 6),
+                                    'minimum':   round(required, 6) })
+
+
+# Check the wire to wire, wire to via and via to via clearances between
+# different signals on each copper layer.  Returns a list of violations,
+# as dicts giving the type, layer, signal names, location and clearance,
+# with lengths in mm.  Pads of elements are not checked.
+def check_board(board, rules):
+    violations = []
+    reported_vias = set()
+    for layer, items in copper_items(board, rules).items():
+        check_layer(items, layer, rules, violations, reported_vias)
+    return violations
+
+
+def main(argv = None, prog = None):
+    parser = argparse.ArgumentParser(prog = prog, description = 'Check the copper clearances of an Eagle board against design rules.')
+    parser.add_argument("board", help = "Eagle board file")
+    parser.add_argument("--rules", help = "Eagle design rules file (default: the rules embedded in the board, if any, otherwise %s)" % os.path.basename(default_rules))
+    parser.add_argument("-o", "--output", help = "JSON report file", type = argparse.FileType('w'), default = sys.stdout)
+    args = parser.parse_args(argv)
+
+    board = EagleBoardFile.load(args.board, lean = True)
+    rules_name = args.rules
+    if args.rules is not None:
+        rules = DesignRules.read(args.rules)
+    else:
+        embedded = board.board.designrules.get_rules()
+        if embedded:
+            rules = DesignRules(embedded)
+            rules_name = board.board.designrules.get_element().get('name')
+        else:
+            rules_name = default_rules
+            rules = DesignRules.read(default_rules)
+    violations = check_board(board, rules)
+    json.dump({ 'board': args.board,
+                'rules': rules_name,
+                'violations': violations },
+              args.output, indent = 2)
+    args.output.write('\n')
+    if violations:
+        print('%d design rule violations' % len(violations), file = sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -16,11 +16,53 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 from abc import ABCMeta
+from array import array
+import collections
+import concurrent.futures
+import copyreg
+import functools
+import gzip
 import io
-from xml.etree.ElementTree import ElementTree, Element, SubElement, Comment, tostring
-
+import itertools
+import lzma
+import math
+import os
+
+# The XML element implementation.  lxml is used if it is installed, as it
+# parses and serializes in C; the standard library's ElementTree is the
+# fallback.  set_xml_backend() can be used to select either one explicitly.
+def set_xml_backend(name):
+    global xml_backend, etree, Element, SubElement, Comment
+    if name == 'lxml':
+        from lxml import etree
+        # lxml elements can't be pickled, but signals are sent to worker
+        # processes for serialization.
+        copyreg.pickle(etree._Element, _pickle_lxml_element)
+    elif name == 'etree':
+        import xml.etree.ElementTree as etree
+    else:
+        raise ValueError('unknown XML backend %s' % name)
+    xml_backend = name
+    Element = etree.Element
+    SubElement = etree.SubElement
+    Comment = etree.Comment
+
+def _pickle_lxml_element(element):
+    return etree.fromstring, (etree.tostring(element, with_tail = False),)
+
+try:
+    set_xml_backend('lxml')
+except ImportError:
+    set_xml_backend('etree')
+
+# If lean is true, wrapper objects added with add_primitive() are not kept
+# in the primitives list once their XML element has been added, which
+# saves memory when nothing needs them later.  Leaf primitives never have
+# children, so they are always lean.
 class EagleXMLElement:
-    def __init__(self, name, text = None, attrs = None, from_element = None):
+    __slots__ = ('element', 'primitives')
+
+    def __init__(self, name, text = None, attrs = None, from_element = None, lean = False):
         if from_element is None:
             if attrs is None:
                 self.element = Element(name)
@@ -30,7 +72,7 @@ class EagleXMLElement:
                 self.element.text = text
         else:
             self.element = from_element
-        self.primitives = []
+        self.primitives = None if lean else []
 
     def get_element(self):
         return self.element
@@ -39,17 +81,22 @@ class EagleXMLElement:
         self.element.append(subelement)
 
     def add_primitive(self, primitive):
-        self.primitives.append(primitive)
+        if self.primitives is not None:
+            self.primitives.append(primitive)
         self.add_subelement(primitive.get_element())
         return primitive
 
 
 class EagleSetting(EagleXMLElement):
+    __slots__ = ()
+
     def __init__(self, name, value):
         super().__init__('setting', attrs = {name: value})
 
 
 class EagleSettings(EagleXMLElement):
+    __slots__ = ('settings',)
+
     def __init__(self):
         super().__init__('settings')
         self.settings = []
@@ -60,6 +107,8 @@ class EagleSettings(EagleXMLElement):
         
 
 class EagleGrid(EagleXMLElement):
+    __slots__ = ()
+
     def __init__(self):
         super().__init__('grid', attrs = { 'distance': '0.1',
                                            'unitdist': 'inch',
@@ -77,8 +126,61 @@ def eagle_boolean(b):
         return 'yes'
     else:
         return 'no'
+
+
+# Lengths are written with six decimal places.  A board has few distinct
+# coordinate values, since primitives lie on a grid, so the formatted
+# strings are cached by value and shared.  Zero isn't cached, since 0.0
+# and -0.0 are equal but format differently.
+_length_cache = { }
+_length_cache_limit = 1 << 16
+
+def eagle_length(value):
+    s = _length_cache.get(value)
+    if s is None:
+        s = '%.6f' % value
+        if value:
+            if len(_length_cache) >= _length_cache_limit:
+                _length_cache.clear()
+            _length_cache[value] = s
+    return s
     
+# Read an Eagle design rules (.dru) file, which has a "name = value" line
+# for each rule, into a dict of the values as strings, in file order.
+# Values of text rules, such as description[en], have their newlines
+# written as \n.  Each file is only parsed once, unless it changes, since
+# the same rules are typically used for every board of a batch.
+def read_design_rules(path):
+    return dict(_parse_design_rules(os.path.abspath(path), os.stat(path).st_mtime_ns))
+
+@functools.lru_cache(maxsize = 16)
+def _parse_design_rules(path, mtime):
+    rules = []
+    with open(path, encoding = 'utf-8') as f:
+        for line in f:
+            line = line.rstrip('\r\n')
+            if not line.strip():
+                continue
+            name, sep, value = line.partition('=')
+            if not sep:
+                raise ValueError("%s: bad design rule line '%s'" % (path, line))
+            rules.append((name.strip(), value.strip()))
+    return tuple(rules)
+
+
+# Move an element and its descendants by (dx, dy), by adjusting their
+# coordinate attributes.
+def translate_element(element, dx, dy):
+    for e in element.iter():
+        for name, d in (('x', dx), ('x1', dx), ('x2', dx), ('y', dy), ('y1', dy), ('y2', dy)):
+            value = e.get(name)
+            if value is not None:
+                e.set(name, eagle_length(float(value) + d))
+
+
 class EagleLayer(EagleXMLElement):
+    __slots__ = ('number', 'name')
+
     def __init__(self, number, name, color, fill, visible, active):
         super().__init__('layer', attrs = { 'number':  str(number),
                                             'name':    name,
@@ -92,6 +194,8 @@ class EagleLayer(EagleXMLElement):
 
 
 class EagleLayers(EagleXMLElement):
+    __slots__ = ('layers_by_name', 'layers_by_number')
+
     def __init__(self, numlayers = 2):
         super().__init__('layers')
 
@@ -163,8 +267,192 @@ class EagleLayers(EagleXMLElement):
 
 
 
+# Eagle's XML reader doesn't like extremely long lines, so each element
+# goes on its own line, indented two spaces per level.  (Eagle doesn't need
+# the indentation, but it makes it easier to inspect the file as text.)
+# Whitespace-only text and tails are replaced by the indentation, as by the
+# old recursive _indent() function.  With the standard library backend the
+# tree is not modified; with lxml, the subtrees lxml serializes are
+# indented in place by etree.indent(), which changes only their
+# whitespace-only text and tails, so writing again gives the same output.
+# The tree is walked with an explicit stack, so deep trees can't overflow
+# the Python stack, and the output is buffered and written in large
+# chunks.
+
+def _escape_text(text):
+    if '&' in text:
+        text = text.replace('&', '&amp;')
+    if '<' in text:
+        text = text.replace('<', '&lt;')
+    if '>' in text:
+        text = text.replace('>', '&gt;')
+    return text
+
+def _escape_attribute(value):
+    value = _escape_text(value)
+    if '"' in value:
+        value = value.replace('"', '&quot;')
+    if '\r' in value:
+        value = value.replace('\r', '&#13;')
+    if '\n' in value:
+        value = value.replace('\n', '&#10;')
+    if '\t' in value:
+        value = value.replace('\t', '&#09;')
+    return value
+
+def _blank(text):
+    return not text or text.isspace()
+
+_flush_size = 4096
+
+# Write elem, indented for the given level, without its tail.  An
+# iterable given for an element in children supplies its children in
+# place of its actual ones.  Children may also be bytes, which are
+# written as they are; they are the serialization of one or more
+# elements by write_fragment().  Returns whether the element had any
+# children.
+#
+# With the lxml backend, subtrees none of whose elements have overridden
+# children are indented in place and serialized by lxml, which differs
+# from the standard library only in writing empty elements as <name/>.
+def _write_element(outfile, root, level = 0, children = None):
+    pieces = []
+    append = pieces.append
+    children = children or {}
+    native = xml_backend == 'lxml'
+    if native:
+        overridden = set(children)
+        for elem in children:
+            overridden.update(elem.iterancestors())
+
+    def flush():
+        outfile.write(''.join(pieces).encode('utf-8'))
+        pieces.clear()
+
+    # Write the start of an element.  Returns an iterator over its children,
+    # or None if the element has been written completely.
+    def start(elem, level):
+        if isinstance(elem, bytes):
+            flush()
+            outfile.write(elem)
+            return None
+        tag = elem.tag
+        if tag is Comment:
+            append('<!--%s-->' % _escape_text(elem.text))
+            return None
+        if native and elem not in overridden:
+            flush()
+            etree.indent(elem, level = level)
+            outfile.write(etree.tostring(elem, encoding = 'utf-8', with_tail = False))
+            return None
+        append('<' + tag)
+        for name, value in elem.items():
+            append(' %s="%s"' % (name, _escape_attribute(value)))
+        kids = iter(children.get(elem, elem))
+        first = next(kids, None)
+        text = elem.text
+        if first is None:
+            if text:
+                append('>%s</%s>' % (_escape_text(text), tag))
+            else:
+                append(' />')
+            return None
+        append('>')
+        append('\n' + '  ' * (level + 1) if _blank(text) else _escape_text(text))
+        return itertools.chain([first], kids)
+
+    def tail(elem, indent):
+        append(indent if isinstance(elem, bytes) or _blank(elem.tail) else _escape_text(elem.tail))
+
+    kids = start(root, level)
+    if kids is None:
+        flush()
+        return native and len(root) > 0
+    stack = [[root, kids, None]]  # element, children, previous child
+    while stack:
+        entry = stack[-1]
+        elem, kids, previous = entry
+        depth = level + len(stack) - 1
+        child = next(kids, None)
+        if child is None:
+            if previous is not None:
+                tail(previous, '\n' + '  ' * depth)
+            append('</%s>' % elem.tag)
+            stack.pop()
+            if stack:
+                stack[-1][2] = elem
+            continue
+        if previous is not None:
+            tail(previous, '\n' + '  ' * (depth + 1))
+        kids = start(child, depth + 1)
+        if kids is None:
+            entry[2] = child
+        else:
+            entry[2] = None
+            stack.append([child, kids, None])
+        if len(pieces) >= _flush_size:
+            flush()
+    flush()
+    return True
+
+def write_xml(outfile, root, children = None):
+    outfile.write(b"<?xml version='1.0' encoding='utf-8'?>\n")
+    if _write_element(outfile, root, 0, children):
+        outfile.write(b'\n' if _blank(root.tail) else _escape_text(root.tail).encode('utf-8'))
+    elif root.tail:
+        outfile.write(_escape_text(root.tail).encode('utf-8'))
+
+# Serialize sibling elements at the given level, separated by indentation,
+# for inclusion as a child chunk by _write_element().
+def write_fragment(elements, level):
+    outfile = io.BytesIO()
+    separator = ('\n' + '  ' * level).encode('utf-8')
+    for i, elem in enumerate(elements):
+        if i:
+            outfile.write(separator)
+        _write_element(outfile, elem, level)
+    return outfile.getvalue()
+
+
+# Board files can be compressed, which is indicated by the suffix of the
+# file name.  gzip's default level 9 is several times slower than level 6
+# for a negligible gain on board files.
+_compressors = { 'gz': lambda file, mode: gzip.open(file, mode, compresslevel = 6),
+                 'xz': lzma.open }
+
+compressions = list(_compressors)
+
+# The compression of a file, from its name, or None.
+def compression(filename):
+    suffix = os.path.splitext(filename)[1][1:]
+    return suffix if suffix in _compressors else None
+
+# Open a binary file by name, or wrap a binary file object, compressing
+# or decompressing it if compress is 'gz' or 'xz', or, if compress is
+# None, if the name has one of those suffixes.  A file object that isn't
+# compressed is returned as it is.
+def open_board_file(file, mode = 'rb', compress = None):
+    name = file if isinstance(file, str) else getattr(file, 'name', None)
+    if compress is None and isinstance(name, str):
+        compress = compression(name)
+    if compress is not None:
+        return _compressors[compress](file, mode)
+    if isinstance(file, str):
+        return open(file, mode)
+    return file
+
+
 class EagleFile(metaclass = ABCMeta):
-    def __init__(self, numlayers = 2):
+    __slots__ = ('eagle', 'drawing', 'settings', 'grid', 'layers')
+
+    def __init__(self, numlayers = 2, from_element = None):
+        if from_element is not None:
+            self.eagle = from_element
+            self.drawing = from_element.find('drawing')
+            for name in ['settings', 'grid', 'layers']:
+                setattr(self, name, EagleXMLElement(name, from_element = self.drawing.find(name)))
+            return
+
         self.eagle = Element('eagle', { 'version': '6.5.0' })
         self.drawing = SubElement(self.eagle, 'drawing')
 
@@ -177,61 +465,51 @@ class EagleFile(metaclass = ABCMeta):
         self.layers = EagleLayers(numlayers = numlayers)
         self.drawing.append(self.layers.get_element())
 
-    # Eagle's XML reader doesn't like extremely long lines, and xml.etree.ElementTree
-    # doesn't have built-in support for pretty printing, so this function can be used
-    # to add suitable 'tails' to each element for newlines and indentation.  (Eagle
-    # doesn't need the indentation, but it makes it easier to inspect the library as
-    # text.)
-    #   http://stackoverflow.com/questions/3095434/inserting-newlines-in-xml-file-generated-via-xml-etree-elementtree-in-python
-    def _indent(self, elem, level=0):
-        i = "\n" + level*"  "
-        if len(elem):
-            if not elem.text or not elem.text.strip():
-                elem.text = i + "  "
-            if not elem.tail or not elem.tail.strip():
-                elem.tail = i
-            for elem in elem:
-                self._indent(elem, level+1)
-            if not elem.tail or not elem.tail.strip():
-                elem.tail = i
-        else:
-            if level and (not elem.tail or not elem.tail.strip()):
-                elem.tail = i
-        
-
     def write(self, outfile):
+        self._write(outfile)
+
+    # children maps elements to iterables of child elements to be written in
+    # place of their actual children, which need not all be in memory at once.
+    def _write(self, outfile, children = None):
+        if isinstance(outfile, str):
+            with open_board_file(outfile, 'wb') as f:
+                return self._write(f, children)
         # We can't write XML to a text file (e.g., stdout),
         # so if it is a text file, get the underlying binary file
         if isinstance(outfile, io.TextIOBase):
             outfile = outfile.buffer
-
-        self._indent(self.eagle)
-        doc = ElementTree(self.eagle)
-        doc.write(outfile, encoding='utf-8', xml_declaration=True)
-
+        write_xml(outfile, self.eagle, children)
 
 
 class EaglePrimitive(EagleXMLElement):
-    def __init__(self, kind, text = None, attrs = None):
-        super().__init__(kind, text = text, attrs = attrs)
+    __slots__ = ()
+
+    def __init__(self, kind, text = None, attrs = None, from_element = None, lean = True):
+        super().__init__(kind, text = text, attrs = attrs, from_element = from_element, lean = lean)
 
 
 class EagleRectangle(EaglePrimitive):
+    __slots__ = ()
+
     def __init__(self, layer, x1, y1, x2, y2):
         super().__init__('rectangle', { 'layer': str(layer),
-                                        'x1': '%.6f' % x1,
-                                        'y1': '%.6f' % y1,
-                                        'x2': '%.6f' % x2,
-                                        'y2': '%.6f' % y2 })
+                                        'x1': eagle_length(x1),
+                                        'y1': eagle_length(y1),
+                                        'x2': eagle_length(x2),
+                                        'y2': eagle_length(y2) })
 
 
 class EaglePackage(EagleXMLElement):
+    __slots__ = ('name',)
+
     def __init__(self, name):
         super().__init__('package', {'name': name })
         self.name = name
 
 
 class EaglePackages(EagleXMLElement):
+    __slots__ = ('packages',)
+
     def __init__(self):
         super().__init__('packages')
         self.packages = {}
@@ -242,16 +520,22 @@ class EaglePackages(EagleXMLElement):
 
 
 class EagleSymbols(EagleXMLElement):
+    __slots__ = ()
+
     def __init__(self):
         super().__init__('symbols')
 
 
 class EagleTechnology(EagleXMLElement):
+    __slots__ = ()
+
     def __init__(self, name):
         super().__init__('technology', { 'name': name })
 
 
 class EagleTechnologies(EagleXMLElement):
+    __slots__ = ('technologies',)
+
     def __init__(self):
         super().__init__('technologies')
         self.technologies = { '': EagleTechnology('') }
@@ -259,6 +543,8 @@ class EagleTechnologies(EagleXMLElement):
 
 
 class EagleDevice(EagleXMLElement):
+    __slots__ = ('technologies',)
+
     def __init__(self, name, package):
         super().__init__('device', { 'name': name,
                                      'package': package })
@@ -267,11 +553,15 @@ class EagleDevice(EagleXMLElement):
 
 
 class EagleGates(EagleXMLElement):
+    __slots__ = ()
+
     def __init__(self):
         super().__init__('gates')
 
 
 class EagleDevices(EagleXMLElement):
+    __slots__ = ('devices',)
+
     def __init__(self):
         super().__init__('devices')
         self.devices = []
@@ -282,6 +572,8 @@ class EagleDevices(EagleXMLElement):
 
 
 class EagleDeviceset(EagleXMLElement):
+    __slots__ = ('gates', 'devices')
+
     def __init__(self, name):
         super().__init__('deviceset', { 'name': name })
         self.gates = EagleGates()
@@ -294,6 +586,8 @@ class EagleDeviceset(EagleXMLElement):
 
 
 class EagleDevicesets(EagleXMLElement):
+    __slots__ = ('devicesets',)
+
     def __init__(self):
         super().__init__('devicesets')
         self.devicesets = []
@@ -304,6 +598,8 @@ class EagleDevicesets(EagleXMLElement):
 
 
 class EagleLibrary(EagleXMLElement):
+    __slots__ = ('packages', 'symbols', 'devicesets')
+
     def __init__(self):
         super().__init__('library')
         self.packages = EaglePackages()
@@ -321,112 +617,356 @@ class EagleLibrary(EagleXMLElement):
 
 
 class EaglePlain(EagleXMLElement):
-    def __init__(self):
-        super().__init__('plain')
+    __slots__ = ()
+
+    def __init__(self, from_element = None, lean = False):
+        super().__init__('plain', from_element = from_element, lean = lean)
 
 class EagleLibraries(EagleXMLElement):
-    def __init__(self):
-        super().__init__('libraries')
+    __slots__ = ()
+
+    def __init__(self, from_element = None, lean = False):
+        super().__init__('libraries', from_element = from_element, lean = lean)
 
 class EagleAttributes(EagleXMLElement):
-    def __init__(self):
-        super().__init__('attributes')
+    __slots__ = ()
+
+    def __init__(self, from_element = None, lean = False):
+        super().__init__('attributes', from_element = from_element, lean = lean)
 
 class EagleVariantdefs(EagleXMLElement):
-    def __init__(self):
-        super().__init__('variantdefs')
+    __slots__ = ()
+
+    def __init__(self, from_element = None, lean = False):
+        super().__init__('variantdefs', from_element = from_element, lean = lean)
 
 class EagleClasses(EagleXMLElement):
-    def __init__(self):
-        super().__init__('classes')
+    __slots__ = ()
+
+    def __init__(self, from_element = None, lean = False):
+        super().__init__('classes', from_element = from_element, lean = lean)
 
 class EagleDesignrules(EagleXMLElement):
-    def __init__(self):
-        super().__init__('designrules')
+    __slots__ = ()
+
+    def __init__(self, from_element = None, lean = False):
+        super().__init__('designrules', from_element = from_element, lean = lean)
+
+    # Replace the rules with those of a dict from read_design_rules(), as
+    # a description element per language followed by a param element per
+    # rule, as Eagle writes them.
+    def set_rules(self, name, rules):
+        self.element.clear()
+        self.element.set('name', name)
+        if self.primitives is not None:
+            self.primitives = []
+        for key, value in rules.items():
+            if key.startswith('description[') and key.endswith(']'):
+                self.add_primitive(EaglePrimitive('description', text = value.replace('\\n', '\n'),
+                                                  attrs = { 'language': key[len('description['):-1] }))
+        for key, value in rules.items():
+            if not key.startswith('description['):
+                self.add_primitive(EaglePrimitive('param', attrs = { 'name': key, 'value': value }))
+
+    # The rules as a dict like that from read_design_rules(), empty if
+    # there are none.
+    def get_rules(self):
+        rules = { }
+        for child in self.element:
+            if child.tag == 'description':
+                rules['description[%s]' % child.get('language')] = (child.text or '').replace('\n', '\\n')
+            elif child.tag == 'param':
+                rules[child.get('name')] = child.get('value')
+        return rules
 
 class EagleAutorouter(EagleXMLElement):
-    def __init__(self):
-        super().__init__('autorouter')
+    __slots__ = ()
+
+    def __init__(self, from_element = None, lean = False):
+        super().__init__('autorouter', from_element = from_element, lean = lean)
 
 class EagleElements(EagleXMLElement):
-    def __init__(self):
-        super().__init__('elements')
+    __slots__ = ()
+
+    def __init__(self, from_element = None, lean = False):
+        super().__init__('elements', from_element = from_element, lean = lean)
 
 
+# A compact signal records its wires and vias in arrays rather than as
+# EagleWire and EagleVia objects and their XML elements, which take an
+# order of magnitude more memory, and only builds the XML when written.
 class EagleSignal(EaglePrimitive):
-    def __init__(self, name):
-        super().__init__('signal', attrs = { 'name' : name })
+    __slots__ = ('compact', 'kinds', 'wire_coords', 'wire_layers', 'via_coords', 'via_extents', 'via_shapes')
+
+    WIRE = 0
+    VIA = 1
+
+    def __init__(self, name = None, from_element = None, compact = False, lean = False):
+        super().__init__('signal', attrs = { 'name' : name }, from_element = from_element, lean = lean)
+        self.compact = compact
+        if compact:
+            self.kinds = array('B')        # WIRE or VIA for each primitive, in order
+            self.wire_coords = array('d')  # x1, y1, x2, y2, width for each wire
+            self.wire_layers = array('B')
+            self.via_coords = array('d')   # x, y, drill, diameter (NaN for automatic) for each via
+            self.via_extents = array('B')  # first and last layer for each via
+            self.via_shapes = { }          # shape by via index, for vias that aren't round
+
+    def get_name(self):
+        return self.element.get('name')
+
+    def set_name(self, name):
+        self.element.set('name', name)
+
+    # Number of wires, vias and other primitives in the signal.
+    def primitive_count(self):
+        if self.compact:
+            return len(self.kinds)
+        return len(self.element)
+
+    # Move the signal by (dx, dy).
+    def translate(self, dx, dy):
+        if not self.compact:
+            translate_element(self.element, dx, dy)
+            return
+        wc = self.wire_coords
+        for i in range(0, len(wc), 5):
+            wc[i] += dx
+            wc[i+1] += dy
+            wc[i+2] += dx
+            wc[i+3] += dy
+        vc = self.via_coords
+        for i in range(0, len(vc), 4):
+            vc[i] += dx
+            vc[i+1] += dy
 
     def add_wire(self, x1, y1, x2, y2, layer, width):
-        self.add_primitive(EagleWire(x1, y1, x2, y2, layer, width))
+        if self.compact:
+            self.kinds.append(self.WIRE)
+            self.wire_coords.extend((x1, y1, x2, y2, width))
+            self.wire_layers.append(layer)
+        else:
+            self.add_primitive(EagleWire(x1, y1, x2, y2, layer, width))
 
     def add_via(self, x, y, drill, diameter = None, extent = (1, 16), shape = None):
-        self.add_primitive(EagleVia(x, y, drill, diameter, extent, shape))
+        if self.compact:
+            if shape is not None:
+                self.via_shapes[len(self.via_extents) // 2] = shape
+            self.kinds.append(self.VIA)
+            self.via_coords.extend((x, y, drill, math.nan if diameter is None else diameter))
+            self.via_extents.extend(extent)
+        else:
+            self.add_primitive(EagleVia(x, y, drill, diameter, extent, shape))
+
+    # Add a wire for each (x1, y1, x2, y2) in segments, which may be any
+    # iterable of 4-sequences, such as a list of tuples or an N x 4 array.
+    def add_wires(self, segments, layer, width):
+        if not self.compact:
+            for x1, y1, x2, y2 in segments:
+                self.add_primitive(EagleWire(x1, y1, x2, y2, layer, width))
+            return
+        start = len(self.wire_layers)
+        extend = self.wire_coords.extend
+        for x1, y1, x2, y2 in segments:
+            extend((x1, y1, x2, y2, width))
+        count = len(self.wire_coords) // 5 - start
+        self.kinds.extend(bytes([self.WIRE]) * count)
+        self.wire_layers.extend(bytes([layer]) * count)
+
+    # Add wires joining each consecutive pair of (x, y) in points.
+    def add_polyline(self, points, layer, width):
+        points = list(points)
+        self.add_wires([(x1, y1, x2, y2) for (x1, y1), (x2, y2) in zip(points, points[1:])],
+                       layer, width)
+
+    # Make a compact signal from an existing signal element, if it has
+    # nothing but wires and vias with attributes the arrays can represent;
+    # otherwise wrap the element as it is.
+    @classmethod
+    def from_xml(cls, element, lean = False):
+        signal = cls(from_element = Element('signal', dict(element.attrib)), compact = True, lean = lean)
+        kinds = signal.kinds
+        wire_coords = signal.wire_coords
+        wire_layers = signal.wire_layers
+        try:
+            for child in element:
+                attrs = child.attrib
+                if len(child) or not _blank(child.text):
+                    raise ValueError
+                if child.tag == 'wire' and len(attrs) == 6:
+                    wire_coords.extend((float(attrs['x1']), float(attrs['y1']),
+                                        float(attrs['x2']), float(attrs['y2']),
+                                        float(attrs['width'])))
+                    wire_layers.append(int(attrs['layer']))
+                    kinds.append(cls.WIRE)
+                elif child.tag == 'via' and set(attrs.keys()) <= cls._via_attributes:
+                    diameter = attrs.get('diameter')
+                    extent = attrs.get('extent')
+                    signal.add_via(float(attrs['x']), float(attrs['y']), float(attrs['drill']),
+                                   None if diameter is None else float(diameter),
+                                   (1, 16) if extent is None else tuple(int(layer) for layer in extent.split('-')),
+                                   attrs.get('shape'))
+                else:
+                    raise ValueError
+        except (KeyError, ValueError, OverflowError):
+            return cls(from_element = element, lean = lean)
+        return signal
+
+    _via_attributes = { 'x', 'y', 'drill', 'diameter', 'extent', 'shape' }
+
+    # The wires of the signal as (x1, y1, x2, y2, layer, width), whether
+    # or not the signal is compact.
+    def wires(self):
+        if self.compact:
+            wc = self.wire_coords
+            return [(wc[i*5], wc[i*5+1], wc[i*5+2], wc[i*5+3], layer, wc[i*5+4])
+                    for i, layer in enumerate(self.wire_layers)]
+        return [(float(e.get('x1')), float(e.get('y1')), float(e.get('x2')), float(e.get('y2')),
+                 int(e.get('layer')), float(e.get('width')))
+                for e in self.element.findall('wire')]
+
+    # The vias of the signal as (x, y, drill, diameter, extent, shape),
+    # with diameter None for automatic and shape None for round.
+    def vias(self):
+        if self.compact:
+            vc = self.via_coords
+            ve = self.via_extents
+            return [(vc[i*4], vc[i*4+1], vc[i*4+2], None if math.isnan(vc[i*4+3]) else vc[i*4+3],
+                     (ve[i*2], ve[i*2+1]), self.via_shapes.get(i))
+                    for i in range(len(ve) // 2)]
+        vias = []
+        for e in self.element.findall('via'):
+            diameter = e.get('diameter')
+            extent = e.get('extent')
+            vias.append((float(e.get('x')), float(e.get('y')), float(e.get('drill')),
+                         None if diameter is None else float(diameter),
+                         (1, 16) if extent is None else tuple(int(layer) for layer in extent.split('-')),
+                         e.get('shape')))
+        return vias
+
+    # Return the complete XML element for the signal, building it from the
+    # arrays if the signal is compact.
+    def materialize(self):
+        if not self.compact:
+            return self.element
+        element = Element('signal', dict(self.element.attrib))
+        wc = self.wire_coords
+        wl = self.wire_layers
+        vc = self.via_coords
+        ve = self.via_extents
+        w = 0
+        v = 0
+        for kind in self.kinds:
+            if kind == self.WIRE:
+                element.append(EagleWire(wc[w*5], wc[w*5+1], wc[w*5+2], wc[w*5+3],
+                                         wl[w], wc[w*5+4]).get_element())
+                w += 1
+            else:
+                diameter = vc[v*4+3]
+                element.append(EagleVia(vc[v*4], vc[v*4+1], vc[v*4+2],
+                                        None if math.isnan(diameter) else diameter,
+                                        (ve[v*2], ve[v*2+1]),
+                                        self.via_shapes.get(v)).get_element())
+                v += 1
+        return element
 
 
 class EagleSignals(EagleXMLElement):
-    def __init__(self):
-        super().__init__('signals')
+    __slots__ = ('lean',)
+
+    # Signals are always kept, since they are written one at a time; lean
+    # applies to the signals created by add_signal().
+    def __init__(self, from_element = None, lean = False):
+        super().__init__('signals', from_element = from_element)
+        self.lean = lean
+        if from_element is not None:
+            self.primitives = [EagleSignal(from_element = e, lean = lean) for e in from_element]
 
     def add_signal(self, name):
-        return self.add_primitive(EagleSignal(name))
+        return self.add_primitive(EagleSignal(name, lean = self.lean))
+
+    # Replace the existing signal of the same name, keeping its position.
+    def replace_signal(self, signal):
+        name = signal.get_name()
+        for i, old in enumerate(self.primitives):
+            if old.get_name() == name:
+                break
+        else:
+            raise KeyError("no signal named '%s'" % name)
+        index = list(self.element).index(old.get_element())
+        self.element.remove(old.get_element())
+        self.element.insert(index, signal.get_element())
+        self.primitives[i] = signal
+        return signal
 
 
 class EagleWire(EaglePrimitive):
+    __slots__ = ()
+
     def __init__(self, x1, y1, x2, y2, layer, width):
         super().__init__('wire', attrs = { 'layer': str(layer),
-                                           'width': '%.6f' % width,
-                                           'x1': '%.6f' % x1,
-                                           'y1': '%.6f' % y1,
-                                           'x2': '%.6f' % x2,
-                                           'y2': '%.6f' % y2 })
+                                           'width': eagle_length(width),
+                                           'x1': eagle_length(x1),
+                                           'y1': eagle_length(y1),
+                                           'x2': eagle_length(x2),
+                                           'y2': eagle_length(y2) })
 
 
 class EagleText(EaglePrimitive):
+    __slots__ = ()
+
     def __init__(self, text, x, y, size, align, layer):
-        super().__init__('text', text = text, attrs = { 'x': '%.6f' % x,
-                                                        'y': '%.6f' % y,
-                                                        'size': '%.6f' % size,
+        super().__init__('text', text = text, attrs = { 'x': eagle_length(x),
+                                                        'y': eagle_length(y),
+                                                        'size': eagle_length(size),
                                                         'layer': str(layer),
                                                         'align': str(align) })
 
 class EagleVia(EaglePrimitive):
+    __slots__ = ()
+
     def __init__(self, x, y, drill,
                  diameter = None, # None for automatic
                  extent = (1, 16),
                  shape = None): # None for round
-        d = { 'x': '%.6f' % x,
-              'y': '%.6f' % y,
-              'drill': '%.6f' % drill,
+        d = { 'x': eagle_length(x),
+              'y': eagle_length(y),
+              'drill': eagle_length(drill),
               'extent': '%d-%d' % (extent[0], extent[1]) }
         if diameter is not None:
-            d['diameter'] = '%.6f' % diameter
+            d['diameter'] = eagle_length(diameter)
         if shape is not None:
             d['shape'] = shape
         super().__init__('via', attrs = d)
 
 
 class EagleBoard(EagleXMLElement):
-    def __init__(self, numlayers = 2):
-        super().__init__('board')
-        self.plain = EaglePlain()
-        self.add_subelement(self.plain.get_element())
-        self.libraries = EagleLibraries()
-        self.add_subelement(self.libraries.get_element())
-        self.attributes = EagleAttributes()
-        self.add_subelement(self.attributes.get_element())
-        self.variantdefs = EagleVariantdefs()
-        self.add_subelement(self.variantdefs.get_element())
-        self.classes = EagleClasses()
-        self.add_subelement(self.classes.get_element())
-        self.designrules = EagleDesignrules()
-        self.add_subelement(self.designrules.get_element())
-        self.autorouter = EagleAutorouter()
-        self.add_subelement(self.autorouter.get_element())
-        self.elements = EagleElements()
-        self.add_subelement(self.elements.get_element())
-        self.signals = EagleSignals()
-        self.add_subelement(self.signals.get_element())
+    _sections = [('plain',       EaglePlain),
+                 ('libraries',   EagleLibraries),
+                 ('attributes',  EagleAttributes),
+                 ('variantdefs', EagleVariantdefs),
+                 ('classes',     EagleClasses),
+                 ('designrules', EagleDesignrules),
+                 ('autorouter',  EagleAutorouter),
+                 ('elements',    EagleElements),
+                 ('signals',     EagleSignals)]
+
+    __slots__ = tuple(name for name, section_class in _sections)
+
+    def __init__(self, numlayers = 2, from_element = None, lean = False):
+        super().__init__('board', from_element = from_element)
+        for name, section_class in self._sections:
+            if from_element is None:
+                section = section_class(lean = lean)
+                self.add_subelement(section.get_element())
+            else:
+                section_element = from_element.find(name)
+                if section_element is None:
+                    section = section_class(lean = lean)
+                    self.add_subelement(section.get_element())
+                else:
+                    section = section_class(from_element = section_element, lean = lean)
+            setattr(self, name, section)
 
     def add_rectangular_board_outline(self, x1, y1, x2, y2):
         self.plain.add_primitive(EagleWire(x1 = x1, y1 = y1,
@@ -445,12 +985,26 @@ class EagleBoard(EagleXMLElement):
     def add_signal(self, name):
         return self.signals.add_signal(name)
 
+    def append_signal(self, signal):
+        return self.signals.add_primitive(signal)
+
+    def add_wires(self, segments, layer, width):
+        for x1, y1, x2, y2 in segments:
+            self.plain.add_primitive(EagleWire(x1, y1, x2, y2, layer, width))
+
+    def add_polyline(self, points, layer, width):
+        points = list(points)
+        self.add_wires([(x1, y1, x2, y2) for (x1, y1), (x2, y2) in zip(points, points[1:])],
+                       layer, width)
+
     def add_text(self, text, x, y, size, align, layer):
         return self.plain.add_primitive(EagleText(text, x, y, size, align, layer))
         
 
 
 class EagleLibraryFile(EagleFile):
+    __slots__ = ('library',)
+
     def __init__(self):
         super().__init__()
         self.library = EagleLibrary()
@@ -464,10 +1018,47 @@ class EagleLibraryFile(EagleFile):
 
 
 class EagleBoardFile(EagleFile):
-    def __init__(self, numlayers = 2):
-        super().__init__(numlayers)
-        self.board = EagleBoard()
-        self.drawing.append(self.board.get_element())
+    __slots__ = ('board',)
+
+    def __init__(self, numlayers = 2, from_element = None, lean = False):
+        super().__init__(numlayers, from_element = from_element)
+        if from_element is None:
+            self.board = EagleBoard(lean = lean)
+            self.drawing.append(self.board.get_element())
+        else:
+            self.board = EagleBoard(from_element = self.drawing.find('board'), lean = lean)
+
+    # Read an existing board file, e.g. one previously written by write().
+    @classmethod
+    def read(cls, infile, lean = False):
+        if isinstance(infile, str):
+            with open_board_file(infile) as f:
+                return cls.read(f, lean = lean)
+        return cls(from_element = etree.parse(infile).getroot(), lean = lean)
+
+    # Read an existing board file incrementally.  Each signal is converted
+    # to a compact signal, when it can be, as soon as it has been parsed,
+    # and its XML is discarded, so the whole tree of signals is never in
+    # memory.  The rest of the board is kept as XML.
+    @classmethod
+    def load(cls, infile, lean = False):
+        if isinstance(infile, str):
+            with open_board_file(infile) as f:
+                return cls.load(f, lean = lean)
+        signals = []
+        parents = []
+        for event, element in etree.iterparse(infile, events = ('start', 'end')):
+            if event == 'start':
+                parents.append(element)
+                continue
+            parents.pop()
+            if element.tag == 'signal' and len(parents) == 4 and parents[-1].tag == 'signals':
+                parents[-1].remove(element)
+                signals.append(EagleSignal.from_xml(element, lean = lean))
+        board_file = cls(from_element = element, lean = lean)
+        for signal in signals:
+            board_file.append_signal(signal)
+        return board_file
 
     def add_rectangular_board_outline(self, x1, y1, x2, y2):
         self.board.add_rectangular_board_outline(x1, y1, x2, y2)
@@ -475,9 +1066,79 @@ class EagleBoardFile(EagleFile):
     def add_signal(self, name):
         return self.board.add_signal(name)
 
+    def append_signal(self, signal):
+        return self.board.append_signal(signal)
+
+    def replace_signal(self, signal):
+        return self.board.signals.replace_signal(signal)
+
+    def add_wires(self, segments, layer, width):
+        self.board.add_wires(segments, layer, width)
+
+    def add_polyline(self, points, layer, width):
+        self.board.add_polyline(points, layer, width)
+
     def add_text(self, text, x, y, size, align, layer):
         return self.board.add_text(text, x, y, size, align, layer)
 
+    # Embed the rules of a design rules (.dru) file, named after the file.
+    def set_design_rules(self, path):
+        name = os.path.splitext(os.path.basename(path))[0]
+        self.board.designrules.set_rules(name, read_design_rules(path))
+
+    # Signals are written one at a time, so that compact signals need only
+    # be materialized one at a time.  If signals is given, it is an
+    # iterable of further EagleSignal objects which are written after those
+    # already in the board as the iterable produces them, so that the
+    # whole tree is never in memory.
+    #
+    # If workers is greater than one, the signals are serialized by that
+    # many worker processes in chunks of about chunk_size wires and vias,
+    # and the chunks are written in order as they complete.
+    def write(self, outfile, signals = None, workers = None, chunk_size = 4096):
+        signals = itertools.chain(self.board.signals.primitives, signals or [])
+        if workers is not None and workers > 1:
+            children = _serialize_signals_parallel(signals, workers, chunk_size)
+        else:
+            children = (signal.materialize() for signal in signals)
+        self._write(outfile, { self.board.signals.get_element(): children })
+
+
+_signal_level = 4  # eagle, drawing, board, signals
+
+def _serialize_signals(signals):
+    return write_fragment((signal.materialize() for signal in signals), _signal_level)
+
+# Serialize signals in worker processes, yielding the serialized chunks
+# in order.  Signals vary widely in size, from a few wires to thousands,
+# so each chunk is as many signals as make up at least chunk_size wires
+# and vias.  The size of a chunk's output is proportional to that, and
+# chunks are submitted only while the chunks outstanding, whether still
+# being serialized or finished and waiting for those before them, have
+# fewer than 2 * workers * chunk_size wires and vias in total.  So the
+# memory used is bounded, and signals produced lazily are not all in
+# memory at once.
+def _serialize_signals_parallel(signals, workers, chunk_size):
+    limit = 2 * workers * chunk_size
+    with concurrent.futures.ProcessPoolExecutor(max_workers = workers) as executor:
+        pending = collections.deque()  # (future, size)
+        outstanding = 0
+        signal = next(signals, None)
+        while signal is not None or pending:
+            if signal is not None and outstanding < limit:
+                chunk = []
+                size = 0
+                while signal is not None and (not chunk or size < chunk_size):
+                    chunk.append(signal)
+                    size += signal.primitive_count()
+                    signal = next(signals, None)
+                pending.append((executor.submit(_serialize_signals, chunk), size))
+                outstanding += size
+                continue
+            future, size = pending.popleft()
+            outstanding -= size
+            yield future.result()
+
 
 '''
 class EagleSchematic(EagleFile):
@@ -16,20 +16,16 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 import argparse
-import io
-import math
+import contextlib
+import logging
+import os
 import sys
 
-# https://github.com/scott-griffiths/bitstring
-from bitstring import BitArray
-
+import drc
+from eagle import EagleBoardFile, compression, compressions, open_board_file
 from length import Length, LengthUnit
 
-from eagle import EagleBoardFile, EaglePackage, EagleDeviceset, EagleDevice, EagleRectangle
-
-
-def get_bit(data, word_width, word, bit):
-    return data[word * word_width + bit]
+from pcbrom import RomParams, WordMap, write_board, merge_board, regenerate_board, verify_board, read_batch_manifest, glob_batch, run_batch, default_map_path
 
 
 show_default_units = ['mil', 'mm']
@@ -50,230 +46,232 @@ class CustomFormatter(argparse.ArgumentDefaultsHelpFormatter):
         return help
 
 
-parser = argparse.ArgumentParser(description='inductively coupled PCB memory generator',
-                                 formatter_class=CustomFormatter)
-
-parser.add_argument("-w", "--words",      help = "word count (drive lines)", type = int, default = 64)
-parser.add_argument("-b", "--bits",       help = "bit count (sense loops)", type = int, default = 64)
-
-parser.add_argument("-u", "--unit",
-                    help = "default distance measurement unit",
-            	    choices = [str(x) for x in LengthUnit.__members__],
-                    default = 'mm')
-
-
-parser.add_argument("--width",             help = "board width",  type = Length, default = Length('3.9 in'))
-parser.add_argument("--length",            help = "board length", type = Length, default = Length('3.9 in'))
-
-parser.add_argument("--trace-width",       help = "trace width", type = Length, default = Length('8.3 mil'))
-
-parser.add_argument("--drive-layer",       help = "drive layer number", type = int, default = 2)
-parser.add_argument("--drive-pitch",       help = "drive pitch", type = Length, default = Length('50 mil'))
-
-#parser.add_argument("--coupling-length",   help = "drive-to-sense trace coupling length in mils", type = Length, default = Length('40 mil'))
-
-parser.add_argument("--sense-layer",       help = "sense layer number", type = int, default = 1)
-parser.add_argument("--sense-pitch",       help = "sense pitch", type = Length, default = Length('50 mil'))
-
-parser.add_argument("--pad-drill",         help = "pad drill diameter", type = Length, default = Length('42 mil'))
-
-#parser.add_argument("--ground-layer",      help = "ground plane layer number (0 for none)", type = int, default = 15)
-
-parser.add_argument("input",      help="ROM data file", type = argparse.FileType('rb'))
-parser.add_argument("-o", "--output",     help="new Eagle board file", type = argparse.FileType('wb'), default = sys.stdout)
+# Options giving the geometry of the ROM array, common to generating and
+# verifying boards.
+def add_geometry_arguments(p):
+    p.add_argument("-w", "--words",      help = "word count (drive lines)", type = int, default = RomParams.words)
+    p.add_argument("-b", "--bits",       help = "bit count (sense loops)", type = int, default = RomParams.bits)
 
+    p.add_argument("-u", "--unit",
+                   help = "default distance measurement unit",
+                   choices = [str(x) for x in LengthUnit.__members__],
+                   default = RomParams.unit)
 
-args = parser.parse_args()
-#print(args)
 
+    p.add_argument("--width",             help = "board width",  type = Length, default = RomParams.width)
+    p.add_argument("--length",            help = "board length", type = Length, default = RomParams.length)
 
-w_conv = 'W%%0%dd' % (1 + int(math.floor(math.log10(args.words - 1))))
-b_conv = 'B%%0%dd' % (1 + int(math.floor(math.log10(args.bits - 1))))
+    p.add_argument("--trace-width",       help = "trace width", type = Length, default = RomParams.trace_width)
 
-default_unit = args.unit
+    p.add_argument("--drive-layer",       help = "drive layer number", type = int, default = RomParams.drive_layer)
+    p.add_argument("--drive-pitch",       help = "drive pitch", type = Length, default = RomParams.drive_pitch)
 
+    #p.add_argument("--coupling-length",   help = "drive-to-sense trace coupling length in mils", type = Length, default = Length('40 mil'))
 
-drive_space = (args.drive_pitch - (3 * args.trace_width)) / 3.0
-#print("drive space %f %s" % (drive_space, default_unit))
+    p.add_argument("--sense-layer",       help = "sense layer number", type = int, default = RomParams.sense_layer)
+    p.add_argument("--sense-pitch",       help = "sense pitch", type = Length, default = RomParams.sense_pitch)
 
-array_width = args.words * args.drive_pitch
-#print("array width %f %s" % (array_width, default_unit))
+    p.add_argument("--pad-drill",         help = "pad drill diameter", type = Length, default = RomParams.pad_drill)
 
-sense_space = (args.sense_pitch - (3 * args.trace_width)) / 3.0
-#print("sense space %f %s" % (sense_space, default_unit))
+    #p.add_argument("--ground-layer",      help = "ground plane layer number (0 for none)", type = int, default = 15)
 
-array_height = args.bits * args.sense_pitch - sense_space
-#print("array height %f %s" % (array_height, default_unit))
 
-data = BitArray(args.input)
-if len(data) != args.words * args.bits:
-    raise RuntimeError("input file size %d bits, should be %d bits\n" % (len(data), args.words * args.bits))
-for i in range(0, len(data), 8):
-    data.reverse(i, i+8)
-
-
-board = EagleBoardFile(numlayers = 4)
-
-board.add_rectangular_board_outline(0, 0, args.width, args.length);
-
-
-y = args.length / 2.0 - ((args.words // 2) - 0.5) * args.drive_pitch
-word_y = [None] * args.words
-for word in range(args.words):
-    word_y [word] = [y,
-                     y - (args.trace_width + drive_space) / 2.0,
-                     y + (args.trace_width + drive_space) / 2.0]
-    y += args.drive_pitch
-
-x = args.width / 2.0 + ((args.bits // 2) - 0.5) * args.sense_pitch
-bit_x = [None] * (args.bits + 1)
-for bit in range(args.bits):
-    # entry is [jog, true, comp]
-    bit_x [bit] = [x,
-                   x - (args.sense_pitch - 2.0 * args.trace_width) / 2.0,
-                   x + (args.sense_pitch - 2.0 * args.trace_width) / 2.0 ]
-    x -= args.sense_pitch
-bit_x[args.bits] = [x, None, None]
-
-for word in range(args.words):
-    name = w_conv % word
-    signal = board.add_signal(name)
-    if word % 2:
-        cx1 = args.width - Length('100.0 mil')
-        cx2 = args.width - Length('200.0 mil')
-        cy = word_y[word][0] - args.drive_pitch / 2.0
-
-        lx = cx2 - Length('50.0 mil')
-        ly = cy
-        ls = name
-        la = 'center-right'
-
-        x1 = cx2 - args.drive_pitch
-        x2 = bit_x[args.bits - 1][1] - 2.0 * args.trace_width
-        x3 = cx2 - 1.5 * args.drive_pitch
-        y1 = word_y[word][2]
-        y2 = word_y[word][1]
-
-        cx1a = cx1 - args.drive_pitch
-        cy1a = cy + args.drive_pitch
-
-        cx2a = x1 + args.drive_pitch / 2.0
-        cy2a = cy1a
-    else:
-        cx1 = Length('100.0 mil')
-        cx2 = Length('200.0 mil')
-        cy = word_y[word][0] + args.drive_pitch / 2.0
-
-        lx = cx2 + Length('50.0 mil')
-        ly = cy
-        ls = name
-        la = 'center-left'
-
-        x1 = cx2 + args.drive_pitch
-        x2 = bit_x[0][2] + 2.0 * args.trace_width
-        x3 = cx2 + 1.5 * args.drive_pitch
-        y1 = word_y[word][1]
-        y2 = word_y[word][2]
-
-        cx1a = cx1 + args.drive_pitch
-        cy1a = cy - args.drive_pitch
-
-        cx2a = x1 - args.drive_pitch / 2.0
-        cy2a = cy1a
-
-    signal.add_wire(cx1,  cy,   cx1a, cy1a, layer=args.drive_layer, width=args.trace_width)
-    signal.add_wire(cx1a, cy1a, cx2a, cy2a, layer=args.drive_layer, width=args.trace_width)
-    signal.add_wire(cx2a, cy2a, x1,   y1,   layer=args.drive_layer, width=args.trace_width)
-    signal.add_wire(x1,   y1,   x2,   y1,   layer=args.drive_layer, width=args.trace_width)
-    signal.add_wire(x2,   y1,   x2,   y2,   layer=args.drive_layer, width=args.trace_width)
-
-    signal.add_wire(x2,   y2,   x3,   y2,   layer=args.drive_layer, width=args.trace_width)
-    signal.add_wire(x3,   y2,   x1,   cy,   layer=args.drive_layer, width=args.trace_width)
-    signal.add_wire(x1,   cy,   cx2,  cy,   layer=args.drive_layer, width=args.trace_width)
-
-    signal.add_via(cx1, cy, drill = args.pad_drill)
-    signal.add_via(cx2, cy, drill = args.pad_drill)
-
-    board.add_text(ls, lx, ly, size=args.drive_pitch, align=la, layer=21)
-
-board.add_text('+', Length('100.0 mil'), word_y[0][0] - args.drive_pitch, size=args.drive_pitch, align='center', layer=21)
-board.add_text('-', Length('200.0 mil'), word_y[0][0] - args.drive_pitch, size=args.drive_pitch, align='center', layer=21)
-board.add_text('-', args.width - Length('200.0 mil'), word_y[0][0] - args.drive_pitch, size=args.drive_pitch, align='center', layer=21)
-board.add_text('+', args.width - Length('100.0 mil'), word_y[0][0] - args.drive_pitch, size=args.drive_pitch, align='center', layer=21)
-board.add_text('+', Length('100.0 mil'), word_y[args.words-1][0] + args.drive_pitch, size=args.drive_pitch, align='center', layer=21)
-board.add_text('-', Length('200.0 mil'), word_y[args.words-1][0] + args.drive_pitch, size=args.drive_pitch, align='center', layer=21)
-board.add_text('-', args.width - Length('200.0 mil'), word_y[args.words-1][0] + args.drive_pitch, size=args.drive_pitch, align='center', layer=21)
-board.add_text('+', args.width - Length('100.0 mil'), word_y[args.words-1][0] + args.drive_pitch, size=args.drive_pitch, align='center', layer=21)
-
-for bit in range(args.bits):
-    signal = board.add_signal(b_conv % bit)
-
-    if bit % 2 == 0:
-        cx = bit_x[bit][0] - args.drive_pitch / 2.0
-        cy1 = Length('100.0 mil')
-        cy2 = args.length - Length('200.0 mil')
-    else:
-        cx = bit_x[bit][0] + args.drive_pitch / 2.0
-        cy1 = Length('200.0 mil')
-        cy2 = args.length - Length('100.0 mil')
-
-    y1 = word_y[0][1] - 2.0 * args.trace_width
-    y2 = word_y[args.words - 1][2] + 2.0 * args.trace_width
-
-    signal.add_via(cx, cy1, drill = args.pad_drill)
-
-    if bit % 2 == 0:
-        signal.add_wire(cx, cy1, cx + args.sense_pitch, cy1 + args.sense_pitch, width=args.trace_width, layer=args.sense_layer)
-        signal.add_wire(cx + args.sense_pitch, cy1 + args.sense_pitch, cx + args.sense_pitch, cy1 + 3.0 * args.sense_pitch, width=args.trace_width, layer=args.sense_layer)
-        signal.add_wire(cx + args.sense_pitch, cy1 + 3.0 * args.sense_pitch, cx + args.sense_pitch / 2.0, cy1 + 3.5 * args.sense_pitch, width=args.trace_width, layer=args.sense_layer)
-        x = bit_x[bit][0]
-        y = word_y[0][1] - 2.0 * args.trace_width
-        signal.add_wire(cx + args.sense_pitch / 2.0, cy1 + 3.5 * args.sense_pitch, x, y, width=args.trace_width, layer=args.sense_layer)
-    else:
-        signal.add_wire(cx, cy1, cx, cy1 + args.sense_pitch, width=args.trace_width, layer=args.sense_layer)
-        signal.add_wire(cx, cy1, cx, cy1 + args.sense_pitch, width=args.trace_width, layer=args.sense_layer)
-        signal.add_wire(cx, cy1 + args.sense_pitch, cx - args.sense_pitch / 2.0, cy1 + 1.5 * args.sense_pitch, width=args.trace_width, layer=args.sense_layer)
-        x = bit_x[bit][0]
-        y = word_y[0][1] - 2.0 * args.trace_width
-        signal.add_wire(cx - args.sense_pitch / 2.0, cy1 + 1.5 * args.sense_pitch, x, y, width=args.trace_width, layer=args.sense_layer)
-
-    for word in range(args.words):
-        data_bit = get_bit(data, args.bits, word, bit)
-        if data_bit == 0:
-            x0 = bit_x[bit][1]
-            x1 = bit_x[bit][2]
+parser = argparse.ArgumentParser(description='inductively coupled PCB memory generator',
+                                 epilog = "use '%(prog)s verify -h' and '%(prog)s drc -h' for help on verifying a board and checking its design rules",
+                                 formatter_class=CustomFormatter)
+add_geometry_arguments(parser)
+
+parser.add_argument("input",      help="ROM data file", type = argparse.FileType('rb'), nargs = '?')
+parser.add_argument("-o", "--output",     help="new Eagle board file, or - for standard output; compressed if its name ends with .gz or .xz", default = '-')
+parser.add_argument("--compress",          help = "compress the output board file(s), adding the suffix to their names if they don't have it", choices = compressions)
+
+parser.add_argument("--optimize-word-order", help = "permute the word order of the drive lines to minimize sense loop jogs", action = 'store_true')
+parser.add_argument("--invert-words",      help = "reverse drive line polarities to minimize sense loop jogs", action = 'store_true')
+parser.add_argument("--word-map",          help = "file to write the drive line to word address and polarity map to (default: the output file name with the suffix .map, if the word order or polarity is optimized)", type = argparse.FileType('w'))
+
+parser.add_argument("--rules",             help = "Eagle design rules (.dru) file to embed in the board, e.g. 4layer6mil.dru")
+
+parser.add_argument("--no-normalize",      help = "don't remove duplicate and zero-length wires or merge collinear runs of wires", dest = 'normalize', action = 'store_false')
+
+parser.add_argument("--stream",            help = "write each signal as it is generated instead of building the whole board in memory", action = 'store_true')
+
+parser.add_argument("--previous-input",    help = "ROM data file the previous board was generated from; only sense loops of changed bits are regenerated", type = argparse.FileType('rb'))
+parser.add_argument("--previous-board",    help = "previous Eagle board file to update incrementally", type = argparse.FileType('rb'))
+parser.add_argument("--previous-word-map", help = "word map file written with the previous board, if its word order or polarity was optimized", type = argparse.FileType('r'))
+
+parser.add_argument("--template",          help = "existing Eagle board file to merge the ROM array into", type = argparse.FileType('rb'))
+parser.add_argument("--origin-x",          help = "x coordinate of the lower left corner of the ROM array on the template board", type = Length, default = Length(0))
+parser.add_argument("--origin-y",          help = "y coordinate of the lower left corner of the ROM array on the template board", type = Length, default = Length(0))
+
+parser.add_argument("--batch",             help = "JSON batch manifest, or glob pattern of ROM data files to generate boards for")
+parser.add_argument("-j", "--jobs",        help = "number of worker processes for batch mode", type = int, default = os.cpu_count())
+parser.add_argument("-v", "--verbose",     help = "report statistics, such as the reduction in wires from normalization", action = 'store_true')
+parser.add_argument("--write-jobs",        help = "number of worker processes for serializing the signals of a single board", type = int, default = 1)
+
+
+verify_parser = argparse.ArgumentParser(prog = os.path.basename(sys.argv[0]) + ' verify',
+                                        description = 'check that the sense loops of a generated board encode a ROM image',
+                                        formatter_class = CustomFormatter)
+add_geometry_arguments(verify_parser)
+verify_parser.add_argument("board",              help = "Eagle board file")
+verify_parser.add_argument("input",              help = "ROM data file", type = argparse.FileType('rb'))
+verify_parser.add_argument("--word-map",         help = "drive line to word address and polarity map the board was generated with", type = argparse.FileType('r'))
+verify_parser.add_argument("--origin-x",         help = "x coordinate of the lower left corner of the ROM array on the board", type = Length, default = Length(0))
+verify_parser.add_argument("--origin-y",         help = "y coordinate of the lower left corner of the ROM array on the board", type = Length, default = Length(0))
+
+
+def verify(argv):
+    args = verify_parser.parse_args(argv)
+    params = RomParams.from_args(args)
+    word_map = None
+    if args.word_map is not None:
+        word_map = WordMap.read(args.word_map)
+        if len(word_map.order) != params.words:
+            verify_parser.error('word map has %d drive lines, should be %d' % (len(word_map.order), params.words))
+    board = EagleBoardFile.load(args.board, lean = True)
+    problems = verify_board(board, args.input.read(), params, word_map, origin = (args.origin_x, args.origin_y))
+    for problem in problems:
+        print('%s: %s' % (args.board, problem), file = sys.stderr)
+    if problems:
+        print('%d bits differ from %s' % (len(problems), args.input.name), file = sys.stderr)
+        sys.exit(1)
+
+
+# Open the output board file, compressed as requested.  It is only opened
+# when it is about to be written, so that it can be the same file as the
+# previous board being updated.  If writing it fails, it is removed, so
+# that a partial board can't be mistaken for a good one.
+@contextlib.contextmanager
+def open_output(args):
+    if args.output == '-':
+        if args.compress is None:
+            yield sys.stdout.buffer
+        else:
+            with open_board_file(sys.stdout.buffer, 'wb', args.compress) as f:
+                yield f
+        return
+    try:
+        with open_board_file(args.output, 'wb', args.compress) as f:
+            yield f
+    except BaseException:
+        if os.path.exists(args.output):
+            os.remove(args.output)
+        raise
+
+
+# Open the file to write the word map to, if the word order or polarity
+# is optimized and no --word-map was given, named after the output, since
+# the board can't be verified or regenerated without it.
+def open_word_map(args):
+    if args.word_map is not None or not (args.optimize_word_order or args.invert_words):
+        return contextlib.nullcontext(args.word_map)
+    if args.output == '-':
+        parser.error('--word-map is required with --optimize-word-order or --invert-words when writing to standard output')
+    return open(default_map_path(args.output), 'w')
+
+
+def same_file(file, path):
+    return path != '-' and os.path.exists(path) and os.path.samefile(file.name, path)
+
+
+def generate(args, params):
+    if (args.previous_input is None) != (args.previous_board is None):
+        parser.error('--previous-input and --previous-board must be given together')
+    if args.previous_word_map is not None and args.previous_input is None:
+        parser.error('--previous-word-map can only be used with --previous-input and --previous-board')
+    if args.previous_input is not None:
+        if args.template is not None:
+            parser.error('--template can not be used for incremental regeneration')
+        word_map = None
+        if args.previous_word_map is not None:
+            try:
+                word_map = WordMap.read(args.previous_word_map)
+            except ValueError as e:
+                parser.error(str(e))
+        elif args.optimize_word_order or args.invert_words:
+            parser.error('--previous-word-map is required to regenerate a board with an optimized word order or polarity')
+        # The previous board is read completely before the output is
+        # opened, so that it can be updated in place.  XML parse errors of
+        # either backend are SyntaxErrors.
+        try:
+            board = regenerate_board(args.previous_input.read(), open_board_file(args.previous_board), args.input.read(), params, word_map)
+        except (ValueError, SyntaxError, EOFError, OSError) as e:
+            parser.error('%s: %s' % (args.previous_board.name, e))
+        with open_output(args) as output:
+            board.write(output, workers = args.write_jobs)
+        return
+
+    if args.template is not None:
+        # The template is read as the output is written.
+        if same_file(args.template, args.output):
+            parser.error('the output can not be the template board')
+        with open_word_map(args) as map_file, open_output(args) as output:
+            try:
+                merge_board(args.input.read(), open_board_file(args.template), output, params, origin = (args.origin_x, args.origin_y),
+                            map_file = map_file, workers = args.write_jobs)
+            except (SyntaxError, EOFError) as e:
+                parser.error('%s: %s' % (args.template.name, e))
+        return
+
+    with open_word_map(args) as map_file, open_output(args) as output:
+        write_board(args.input.read(), output, params, stream = args.stream, map_file = map_file, workers = args.write_jobs)
+
+
+def main():
+    if sys.argv[1:2] == ['verify']:
+        verify(sys.argv[2:])
+        return
+    if sys.argv[1:2] == ['drc']:
+        drc.main(sys.argv[2:], prog = os.path.basename(sys.argv[0]) + ' drc')
+        return
+
+    args = parser.parse_args()
+    params = RomParams.from_args(args)
+    if args.verbose:
+        logging.basicConfig(level = logging.INFO, format = '%(message)s')
+    if args.rules is not None and not os.path.isfile(args.rules):
+        parser.error("design rules file '%s' not found" % args.rules)
+
+    if args.batch is not None:
+        if args.input is not None:
+            parser.error('an input file may not be given with --batch')
+        if args.template is not None:
+            parser.error('--template can not be used with --batch')
+        invalid = []
+        if args.batch.endswith('.json'):
+            try:
+                jobs, invalid = read_batch_manifest(args.batch, params)
+            except (OSError, ValueError) as e:
+                parser.error('bad batch manifest: %s' % e)
         else:
-            x0 = bit_x[bit][2]
-            x1 = bit_x[bit][1]
-        new_x = x0
-        if x0 != x:
-            signal.add_wire(x, y, x0, y, width=args.trace_width, layer=args.sense_layer)
-        signal.add_wire(x0, y, x0, word_y[word][1], width=args.trace_width, layer=args.sense_layer)
-        signal.add_wire(x0, word_y[word][1], x1, word_y[word][1], width=args.trace_width, layer=args.sense_layer)
-        signal.add_wire(x1, word_y[word][1], x1, word_y[word][2], width=args.trace_width, layer=args.sense_layer)
-        signal.add_wire(x1, word_y[word][2], x0, word_y[word][2], width=args.trace_width, layer=args.sense_layer)
-        x = x0
-        y = word_y[word][2] + 2.0 * args.trace_width
-        signal.add_wire(x0, word_y[word][2], x, y, width = args.trace_width, layer = args.sense_layer)
-
-    signal.add_wire(x, y, bit_x[bit][0], y, width = args.trace_width, layer=args.sense_layer)
-
-    if bit % 2 == 0:
-        signal.add_wire(bit_x[bit][0], y, bit_x[bit][0], cy2 - 1.5 * args.sense_pitch, width=args.trace_width, layer=args.sense_layer)
-        signal.add_wire(bit_x[bit][0], cy2 - 1.5 * args.sense_pitch, cx, cy2 - args.sense_pitch, width=args.trace_width, layer=args.sense_layer)
-        signal.add_wire(cx, cy2 - args.sense_pitch, cx, cy2, width = args.trace_width, layer=args.sense_layer)
-    else:
-        signal.add_wire(bit_x[bit][0], y, bit_x[bit][0], cy2 - 3.5 * args.sense_pitch, width=args.trace_width, layer=args.sense_layer)
-        signal.add_wire(bit_x[bit][0], cy2 - 3.5 * args.sense_pitch, cx - args.sense_pitch, cy2 - 3.0 * args.sense_pitch, width=args.trace_width, layer=args.sense_layer)
-        signal.add_wire(cx - args.sense_pitch, cy2 - 3.0 * args.sense_pitch, cx - args.sense_pitch, cy2 - args.sense_pitch, width=args.trace_width, layer=args.sense_layer)
-        signal.add_wire(cx - args.sense_pitch, cy2 - args.sense_pitch, cx, cy2, width=args.trace_width, layer=args.sense_layer)
-    
-    signal.add_via(cx, cy2, drill = args.pad_drill)
-
-
-board.add_text(b_conv % 0, bit_x[0][0] + args.sense_pitch, Length('100.0 mil'), size=args.drive_pitch, align='center-left', layer=21)
-board.add_text(b_conv % (args.bits - 1), bit_x[args.bits - 1][0] - args.sense_pitch, Length('200.0 mil'), size=args.drive_pitch, align='center-right', layer=21)
-board.add_text(b_conv % 0, bit_x[0][0] + args.sense_pitch, args.length - Length('200.0 mil'), size=args.drive_pitch, align='center-left', layer=21)
-board.add_text(b_conv % (args.bits - 1), bit_x[args.bits - 1][0] - args.sense_pitch, args.length - Length('100.0 mil'), size=args.drive_pitch, align='center-right', layer=21)
-
-board.write(args.output)
+            jobs = glob_batch(args.batch, params)
+        if args.compress is not None:
+            jobs = [(input_path, output_path if compression(output_path) else output_path + '.' + args.compress, job_params)
+                    for input_path, output_path, job_params in jobs]
+        failures = 0
+        for input_path, output_path, e in invalid + run_batch(jobs, workers = args.jobs, stream = args.stream):
+            if e is not None:
+                print('%s: %s' % (input_path, str(e).strip()), file = sys.stderr)
+                failures += 1
+        if failures:
+            print('%d of %d boards failed' % (failures, len(invalid) + len(jobs)), file = sys.stderr)
+            sys.exit(1)
+        return
+
+    if args.input is None:
+        parser.error('an input file or --batch is required')
+
+    # Readers choose the compression by the file name, so the output's
+    # name is given the suffix, as in batch mode.
+    if args.compress is not None and args.output != '-':
+        suffix = compression(args.output)
+        if suffix is None:
+            args.output += '.' + args.compress
+        elif suffix != args.compress:
+            parser.error('--compress %s conflicts with the output file name %s' % (args.compress, args.output))
+
+    generate(args, params)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,941 @@
+#!/usr/bin/env python3
+
+# Inductively-coupled memory PCB generation
+# Copyright 2016, 2017 Eric Smith <spacewar@gmail.com>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the version 3 of the GNU General Public License
+# as published by the Free Software Foundation.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import collections
+import concurrent.futures
+from dataclasses import dataclass, fields, replace
+import glob
+import json
+import logging
+import math
+import os
+import re
+from typing import Optional, Union, get_args, get_origin
+
+from bitmatrix import BitMatrix
+
+from length import Length
+
+from eagle import EagleBoardFile, EagleSignal, translate_element, compression, open_board_file
+
+log = logging.getLogger('pcbrom')
+
+
+# Generation parameters, one field per pcb-rom.py command line option.
+@dataclass
+class RomParams:
+    words:       int    = 64                 # word count (drive lines)
+    bits:        int    = 64                 # bit count (sense loops)
+    unit:        str    = 'mm'               # default distance measurement unit
+    width:       Length = Length('3.9 in')   # board width
+    length:      Length = Length('3.9 in')   # board length
+    trace_width: Length = Length('8.3 mil')
+    drive_layer: int    = 2
+    drive_pitch: Length = Length('50 mil')
+    sense_layer: int    = 1
+    sense_pitch: Length = Length('50 mil')
+    pad_drill:   Length = Length('42 mil')
+    optimize_word_order: bool = False        # permute drive lines to minimize sense loop jogs
+    invert_words: bool = False               # reverse drive line polarities to minimize sense loop jogs
+    normalize:   bool   = True               # remove redundant wires
+    rules:       Optional[str] = None        # design rules (.dru) file to embed in the board
+
+    @classmethod
+    def from_args(cls, args):
+        return cls(**{f.name: getattr(args, f.name) for f in fields(cls) if hasattr(args, f.name)})
+
+    # Return a copy with some fields overridden, converting values given
+    # as strings or plain numbers (e.g., from a JSON batch manifest) to
+    # the field's type.
+    def override(self, **overrides):
+        types = {f.name: f.type for f in fields(self)}
+        for name, value in overrides.items():
+            if name not in types:
+                raise ValueError("unknown parameter '%s'" % name)
+            field_type = types[name]
+            if get_origin(field_type) is Union:
+                # Optional[type]: null is None, anything else is the type.
+                if value is None:
+                    continue
+                field_type = next(t for t in get_args(field_type) if t is not type(None))
+            if field_type is bool:
+                overrides[name] = parse_bool(name, value)
+                continue
+            try:
+                overrides[name] = field_type(value)
+            except (TypeError, ValueError) as e:
+                raise ValueError("parameter '%s' must be %s, not %r%s" %
+                                 (name, field_type.__name__, value, ': %s' % e if str(e) else '')) from e
+        return replace(self, **overrides)
+
+
+bool_strings = { 'true': True,  'yes': True,  'on': True,  '1': True,
+                 'false': False, 'no': False, 'off': False, '0': False }
+
+# Convert a boolean parameter value, which may be a bool or a yes/no
+# string, since bool() of any non-empty string is true.
+def parse_bool(name, value):
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, str) and value.strip().lower() in bool_strings:
+        return bool_strings[value.strip().lower()]
+    raise ValueError("parameter '%s' must be true or false, not %r" % (name, value))
+
+
+def hamming_distance(a, b):
+    return bin(a ^ b).count('1')
+
+
+# Number of sense loop jogs between two words on adjacent drive lines,
+# allowing for the second drive line's polarity to be reversed if that is
+# enabled, which inverts every bit read from it.
+def word_distance(params):
+    if params.invert_words:
+        return lambda a, b: min(hamming_distance(a, b), params.bits - hamming_distance(a, b))
+    return hamming_distance
+
+
+# Total number of sense loop jogs, i.e. bit changes between words on
+# adjacent drive lines, for values already in drive line order and
+# polarity.
+def jog_count(values):
+    return sum(hamming_distance(a, b) for a, b in zip(values, values[1:]))
+
+
+# Choose which word each drive line addresses so that adjacent drive lines
+# differ in as few bits as possible, since every difference costs a jog in
+# a sense loop.  This is an open travelling salesman path over Hamming
+# distance, solved approximately by a nearest neighbor tour from word 0
+# improved with 2-opt.  Returns a list giving the word of each drive line.
+def optimize_word_order(values, distance = hamming_distance, max_passes = 20):
+    order = [0]
+    remaining = set(range(1, len(values)))
+    while remaining:
+        last = values[order[-1]]
+        word = min(remaining, key = lambda w: (distance(last, values[w]), w))
+        order.append(word)
+        remaining.remove(word)
+
+    n = len(order)
+    for p in range(max_passes):
+        improved = False
+        for i in range(1, n - 1):
+            a = values[order[i - 1]]
+            b = values[order[i]]
+            d_ab = distance(a, b)
+            for j in range(i + 1, n):
+                # reverse order[i..j]
+                c = values[order[j]]
+                delta = distance(a, c) - d_ab
+                if j + 1 < n:
+                    d = values[order[j + 1]]
+                    delta += distance(b, d) - distance(c, d)
+                if delta < 0:
+                    order[i : j + 1] = reversed(order[i : j + 1])
+                    b = values[order[i]]
+                    d_ab = distance(a, b)
+                    improved = True
+        if not improved:
+            break
+    return order
+
+
+# Choose the polarity of each drive line, given values in drive line
+# order, to minimize the number of jogs.  Reversing a drive line's
+# polarity inverts every bit read from it, so the jogs between adjacent
+# lines are either their Hamming distance or its complement depending on
+# whether their polarities match.  That is a chain, so dynamic programming
+# over the two polarities of each line finds the optimum.  Drive line 0
+# keeps normal polarity.  Returns a list of booleans, true for reversed.
+def optimize_word_polarity(values, bits):
+    if not values:
+        return []
+    cost = [0, None]
+    choices = []
+    for a, b in zip(values, values[1:]):
+        same = hamming_distance(a, b)
+        differ = bits - same
+        new_cost = [None, None]
+        choice = [None, None]
+        for inv in (0, 1):
+            for prev in (0, 1):
+                if cost[prev] is None:
+                    continue
+                c = cost[prev] + (same if prev == inv else differ)
+                if new_cost[inv] is None or c < new_cost[inv]:
+                    new_cost[inv] = c
+                    choice[inv] = prev
+        cost = new_cost
+        choices.append(choice)
+
+    inv = 0 if cost[1] is None or cost[0] <= cost[1] else 1
+    invert = [bool(inv)]
+    for choice in reversed(choices):
+        inv = choice[inv]
+        invert.append(bool(inv))
+    invert.reverse()
+    return invert
+
+
+# Assignment of word addresses to drive lines: drive line n reads word
+# order[n], with its polarity reversed (so all bits inverted) if
+# invert[n] is true.
+class WordMap:
+    def __init__(self, order, invert = None):
+        self.order = order
+        if invert is None:
+            invert = [False] * len(order)
+        self.invert = invert
+
+    @classmethod
+    def identity(cls, words):
+        return cls(list(range(words)))
+
+    @classmethod
+    def optimize(cls, data, params):
+        values = [data.row_value(word) for word in range(params.words)]
+        if params.optimize_word_order:
+            order = optimize_word_order(values, word_distance(params))
+        else:
+            order = list(range(params.words))
+        invert = None
+        if params.invert_words:
+            invert = optimize_word_polarity([values[word] for word in order], params.bits)
+        word_map = cls(order, invert)
+        mask = (1 << params.bits) - 1
+        arranged = [values[word] ^ mask if inv else values[word] for word, inv in zip(word_map.order, word_map.invert)]
+        before = jog_count(values)
+        after = jog_count(arranged)
+        if before:
+            log.info('word map optimization reduced sense loop jogs from %d to %d (%.1f%% fewer)',
+                     before, after, 100.0 * (before - after) / before)
+        return word_map
+
+    def write(self, outfile, geom):
+        outfile.write('# drive line, word address, polarity\n')
+        for line, (word, invert) in enumerate(zip(self.order, self.invert)):
+            outfile.write('%s %d %s\n' % (geom.w_conv % line, word, '-' if invert else '+'))
+
+    # Read a word map written by write().
+    @classmethod
+    def read(cls, infile):
+        order = []
+        invert = []
+        for line in infile:
+            line = line.split('#', 1)[0].split()
+            if not line:
+                continue
+            if len(line) != 3 or line[2] not in '+-':
+                raise ValueError("bad word map line '%s'" % ' '.join(line))
+            order.append(int(line[1]))
+            invert.append(line[2] == '-')
+        return cls(order, invert)
+
+
+# Load ROM data and permute its words into drive line order and polarity.
+# If word_map is not given, it is optimized as requested by params.
+# Returns the arranged data and the word map.
+def arrange_rom_data(data, params, word_map = None):
+    data = load_rom_data(data, params)
+    if word_map is None:
+        if not (params.optimize_word_order or params.invert_words):
+            return data, WordMap.identity(params.words)
+        word_map = WordMap.optimize(data, params)
+    return data.arrange(word_map.order, word_map.invert), word_map
+
+
+def load_rom_data(data, params):
+    if len(data) * 8 != params.words * params.bits:
+        raise RuntimeError("input file size %d bits, should be %d bits\n" % (len(data) * 8, params.words * params.bits))
+    return BitMatrix.from_bytes(data, params.words, params.bits)
+
+
+# Remove zero-length and duplicate wires from segments (x1, y1, x2, y2),
+# and merge each run of touching collinear wires into a single wire,
+# unless something else meets it where they touch: the point must be the
+# end of just those two wires, and not one of the points (x, y) in fixed,
+# such as vias.  Duplicates are found by hashing, and runs are merged in
+# the order of segments, so a path is merged completely in one pass.
+def normalize_segments(segments, fixed = ()):
+    unique = []
+    seen = set()
+    ends = { }
+    for x1, y1, x2, y2 in segments:
+        p1 = (x1, y1)
+        p2 = (x2, y2)
+        if p1 == p2:
+            continue
+        key = frozenset((p1, p2))
+        if key in seen:
+            continue
+        seen.add(key)
+        unique.append((p1, p2))
+        ends[p1] = ends.get(p1, 0) + 1
+        ends[p2] = ends.get(p2, 0) + 1
+
+    fixed = set(fixed)
+    merged = []
+    for r, s in unique:
+        if merged:
+            p, q = merged[-1]
+            if s == q:
+                r, s = s, r
+            if r == q and ends[q] == 2 and q not in fixed:
+                dx1 = q[0] - p[0]
+                dy1 = q[1] - p[1]
+                dx2 = s[0] - q[0]
+                dy2 = s[1] - q[1]
+                if dx1 * dy2 == dy1 * dx2 and dx1 * dx2 + dy1 * dy2 > 0:
+                    merged[-1] = (p, s)
+                    continue
+        merged.append((r, s))
+    return [(x1, y1, x2, y2) for (x1, y1), (x2, y2) in merged]
+
+
+# Maximum number of sense loop templates cached by RomGeometry.
+sense_loop_cache_size = 16
+
+# Indices of the y coordinates of a drive line, see
+# RomGeometry.drive_line_y().
+DRIVE_CY, DRIVE_CYA, DRIVE_Y1, DRIVE_Y2 = range(4)
+
+# Indices of the x coordinates of a sense loop, see
+# RomGeometry.sense_loop_x().
+SENSE_JOG, SENSE_TRUE, SENSE_COMP, SENSE_CX, SENSE_CX_P1, SENSE_CX_PH, SENSE_CX_MH, SENSE_CX_M1 = range(8)
+
+
+class RomGeometry:
+    def __init__(self, params):
+        self.params = params
+
+        self.w_conv = 'W%%0%dd' % (1 + int(math.floor(math.log10(params.words - 1))))
+        self.b_conv = 'B%%0%dd' % (1 + int(math.floor(math.log10(params.bits - 1))))
+
+        self.drive_space = (params.drive_pitch - (3 * params.trace_width)) / 3.0
+
+        self.sense_space = (params.sense_pitch - (3 * params.trace_width)) / 3.0
+
+        y = params.length / 2.0 - ((params.words // 2) - 0.5) * params.drive_pitch
+        self.word_y = [None] * params.words
+        for word in range(params.words):
+            self.word_y [word] = [y,
+                                  y - (params.trace_width + self.drive_space) / 2.0,
+                                  y + (params.trace_width + self.drive_space) / 2.0]
+            y += params.drive_pitch
+
+        x = params.width / 2.0 + ((params.bits // 2) - 0.5) * params.sense_pitch
+        self.bit_x = [None] * (params.bits + 1)
+        for bit in range(params.bits):
+            # entry is [jog, true, comp]
+            self.bit_x [bit] = [x,
+                                x - (params.sense_pitch - 2.0 * params.trace_width) / 2.0,
+                                x + (params.sense_pitch - 2.0 * params.trace_width) / 2.0 ]
+            x -= params.sense_pitch
+        self.bit_x[params.bits] = [x, None, None]
+
+        # Per-word y coordinates used by every sense loop: the bottom and
+        # top of the drive line coupling region, and the y at which the
+        # sense loop leaves the region heading for the next word.
+        self.sense_y_bottom = [wy[1] for wy in self.word_y]
+        self.sense_y_top = [wy[2] for wy in self.word_y]
+        self.sense_y_exit = [wy[2] + 2.0 * params.trace_width for wy in self.word_y]
+        self.sense_y_entry = self.word_y[0][1] - 2.0 * params.trace_width
+
+        self.sense_loop_cache = collections.OrderedDict()
+        self.sense_loop_seen = set()
+
+        # Wires generated, and wires remaining after normalization.
+        self.generated_wires = 0
+        self.wires = 0
+
+        # Drive lines differ only in y coordinates and in the mirroring
+        # of odd words, so each parity's shape is built once.
+        self.drive_y = [self.drive_line_y(word) for word in range(params.words)]
+        self.drive_templates = [self.drive_line_template(0),
+                                self.drive_line_template(1)]
+
+    # y coordinates a drive line uses, as a tuple indexed by the DRIVE_*
+    # constants.
+    def drive_line_y(self, word):
+        params = self.params
+        if word % 2:
+            cy = self.word_y[word][0] - params.drive_pitch / 2.0
+            return (cy, cy + params.drive_pitch, self.word_y[word][2], self.word_y[word][1])
+        else:
+            cy = self.word_y[word][0] + params.drive_pitch / 2.0
+            return (cy, cy - params.drive_pitch, self.word_y[word][1], self.word_y[word][2])
+
+    # Wires (x1, yi1, x2, yi2) and vias (x, yi) of the drive lines of a
+    # parity, with y coordinates given as indices into drive_line_y().
+    def drive_line_template(self, parity):
+        params = self.params
+        if parity:
+            cx1 = params.width - Length('100.0 mil')
+            cx2 = params.width - Length('200.0 mil')
+
+            x1 = cx2 - params.drive_pitch
+            x2 = self.bit_x[params.bits - 1][1] - 2.0 * params.trace_width
+            x3 = cx2 - 1.5 * params.drive_pitch
+
+            cx1a = cx1 - params.drive_pitch
+            cx2a = x1 + params.drive_pitch / 2.0
+        else:
+            cx1 = Length('100.0 mil')
+            cx2 = Length('200.0 mil')
+
+            x1 = cx2 + params.drive_pitch
+            x2 = self.bit_x[0][2] + 2.0 * params.trace_width
+            x3 = cx2 + 1.5 * params.drive_pitch
+
+            cx1a = cx1 + params.drive_pitch
+            cx2a = x1 - params.drive_pitch / 2.0
+
+        wires = [(cx1,  DRIVE_CY,  cx1a, DRIVE_CYA),
+                 (cx1a, DRIVE_CYA, cx2a, DRIVE_CYA),
+                 (cx2a, DRIVE_CYA, x1,   DRIVE_Y1),
+                 (x1,   DRIVE_Y1,  x2,   DRIVE_Y1),
+                 (x2,   DRIVE_Y1,  x2,   DRIVE_Y2),
+                 (x2,   DRIVE_Y2,  x3,   DRIVE_Y2),
+                 (x3,   DRIVE_Y2,  x1,   DRIVE_CY),
+                 (x1,   DRIVE_CY,  cx2,  DRIVE_CY)]
+        vias = [(cx1, DRIVE_CY),
+                (cx2, DRIVE_CY)]
+        count = len(wires)
+        if params.normalize:
+            # The drive lines of the other words of the parity are
+            # translations of this one, so they normalize the same way.
+            ys = self.drive_y[parity]
+            index = { y: yi for yi, y in reversed(list(enumerate(ys))) }
+            wires = [(x1, index[y1], x2, index[y2])
+                     for x1, y1, x2, y2 in normalize_segments([(x1, ys[yi1], x2, ys[yi2])
+                                                               for x1, yi1, x2, yi2 in wires],
+                                                              [(x, ys[yi]) for x, yi in vias])]
+        return wires, vias, count
+
+    # Wires (x1, y1, x2, y2) and vias (x, y) of the drive line of a word.
+    def drive_line(self, word):
+        wires, vias, count = self.drive_templates[word % 2]
+        self.generated_wires += count
+        self.wires += len(wires)
+        ys = self.drive_y[word]
+        return ([(x1, ys[yi1], x2, ys[yi2]) for x1, yi1, x2, yi2 in wires],
+                [(x, ys[yi]) for x, yi in vias])
+
+    # Sense loop pad positions for a bit, as (cx, cy1, cy2).
+    def sense_pads(self, bit):
+        params = self.params
+        if bit % 2 == 0:
+            return (self.bit_x[bit][0] - params.drive_pitch / 2.0,
+                    Length('100.0 mil'),
+                    params.length - Length('200.0 mil'))
+        else:
+            return (self.bit_x[bit][0] + params.drive_pitch / 2.0,
+                    Length('200.0 mil'),
+                    params.length - Length('100.0 mil'))
+
+    # x coordinates a sense loop can use, as a tuple indexed by the
+    # SENSE_* constants.
+    def sense_loop_x(self, bit):
+        sense_pitch = self.params.sense_pitch
+        cx, cy1, cy2 = self.sense_pads(bit)
+        jog_x, true_x, comp_x = self.bit_x[bit]
+        return (jog_x, true_x, comp_x,
+                cx, cx + sense_pitch, cx + sense_pitch / 2.0,
+                cx - sense_pitch / 2.0, cx - sense_pitch)
+
+    # The sense loop for a bit position depends only on the parity of the
+    # bit and the column of data bits, other than its x coordinates, so
+    # it is built once per distinct column as segments (xi1, y1, xi2, y2)
+    # with x coordinates given as indices into sense_loop_x().
+    #
+    # Returns the template and the number of wires generated for it, which
+    # is more than the number in the template if it has been normalized.
+    #
+    # Columns rarely repeat in dense data, so a template is only cached
+    # once its column has been seen before, and only the most recently
+    # used sense_loop_cache_size templates are kept, so that memory
+    # doesn't grow with the size of the array.  Columns are remembered as
+    # seen by their hashes; a collision only causes a useless entry.
+    def sense_loop_template(self, parity, column):
+        key = (parity, bytes(column))
+        cache = self.sense_loop_cache
+        entry = cache.get(key)
+        if entry is not None:
+            cache.move_to_end(key)
+            return entry
+
+        sense_pitch = self.params.sense_pitch
+        cx, cy1, cy2 = self.sense_pads(parity)
+
+        template = []
+        y = self.sense_y_entry
+        if parity == 0:
+            template.append((SENSE_CX, cy1, SENSE_CX_P1, cy1 + sense_pitch))
+            template.append((SENSE_CX_P1, cy1 + sense_pitch, SENSE_CX_P1, cy1 + 3.0 * sense_pitch))
+            template.append((SENSE_CX_P1, cy1 + 3.0 * sense_pitch, SENSE_CX_PH, cy1 + 3.5 * sense_pitch))
+            template.append((SENSE_CX_PH, cy1 + 3.5 * sense_pitch, SENSE_JOG, y))
+        else:
+            template.append((SENSE_CX, cy1, SENSE_CX, cy1 + sense_pitch))
+            template.append((SENSE_CX, cy1, SENSE_CX, cy1 + sense_pitch))
+            template.append((SENSE_CX, cy1 + sense_pitch, SENSE_CX_MH, cy1 + 1.5 * sense_pitch))
+            template.append((SENSE_CX_MH, cy1 + 1.5 * sense_pitch, SENSE_JOG, y))
+
+        # The loop passes the drive line on the true side for a zero bit,
+        # and on the complement side for a one bit.
+        near_x = (SENSE_TRUE, SENSE_COMP)
+        far_x = (SENSE_COMP, SENSE_TRUE)
+        x = SENSE_JOG
+        for data_bit, yb, yt, ye in zip(column, self.sense_y_bottom, self.sense_y_top, self.sense_y_exit):
+            x0 = near_x[data_bit]
+            x1 = far_x[data_bit]
+            if x0 != x:
+                template.append((x, y, x0, y))
+            template += ((x0, y,  x0, yb),
+                         (x0, yb, x1, yb),
+                         (x1, yb, x1, yt),
+                         (x1, yt, x0, yt),
+                         (x0, yt, x0, ye))
+            x = x0
+            y = ye
+
+        template.append((x, y, SENSE_JOG, y))
+
+        if parity == 0:
+            template.append((SENSE_JOG, y, SENSE_JOG, cy2 - 1.5 * sense_pitch))
+            template.append((SENSE_JOG, cy2 - 1.5 * sense_pitch, SENSE_CX, cy2 - sense_pitch))
+            template.append((SENSE_CX, cy2 - sense_pitch, SENSE_CX, cy2))
+        else:
+            template.append((SENSE_JOG, y, SENSE_JOG, cy2 - 3.5 * sense_pitch))
+            template.append((SENSE_JOG, cy2 - 3.5 * sense_pitch, SENSE_CX_M1, cy2 - 3.0 * sense_pitch))
+            template.append((SENSE_CX_M1, cy2 - 3.0 * sense_pitch, SENSE_CX_M1, cy2 - sense_pitch))
+            template.append((SENSE_CX_M1, cy2 - sense_pitch, SENSE_CX, cy2))
+
+        count = len(template)
+        if self.params.normalize:
+            # The sense loops of the other bits of the parity with the same
+            # column are translations of this one, so they normalize the
+            # same way.
+            xs = self.sense_loop_x(parity)
+            index = { x: xi for xi, x in reversed(list(enumerate(xs))) }
+            template = [(index[x1], y1, index[x2], y2)
+                        for x1, y1, x2, y2 in normalize_segments([(xs[xi1], y1, xs[xi2], y2)
+                                                                  for xi1, y1, xi2, y2 in template],
+                                                                 [(cx, cy1), (cx, cy2)])]
+
+        entry = (template, count)
+        if hash(key) in self.sense_loop_seen:
+            cache[key] = entry
+            if len(cache) > sense_loop_cache_size:
+                cache.popitem(last = False)
+        else:
+            self.sense_loop_seen.add(hash(key))
+        return entry
+
+    # Wire segments (x1, y1, x2, y2) of the sense loop for a bit, from the
+    # pad at cy1 to the pad at cy2.  column is the sequence of data bits
+    # for that bit position, indexed by word.
+    def sense_loop_segments(self, bit, column):
+        xs = self.sense_loop_x(bit)
+        template, count = self.sense_loop_template(bit % 2, column)
+        self.generated_wires += count
+        self.wires += len(template)
+        return [(xs[xi1], y1, xs[xi2], y2)
+                for xi1, y1, xi2, y2 in template]
+
+    def log_wire_counts(self):
+        if self.params.normalize and self.generated_wires:
+            log.info('normalization reduced %d wires to %d (%.1f%% fewer)',
+                     self.generated_wires, self.wires,
+                     100.0 * (self.generated_wires - self.wires) / self.generated_wires)
+
+
+# Add the board outline, if outline is true, and silkscreen labels.
+# Drive lines with reversed polarity in word_map are labelled with an
+# overline.
+def add_plain(board, geom, word_map = None, outline = True):
+    params = geom.params
+
+    if outline:
+        board.add_rectangular_board_outline(0, 0, params.width, params.length);
+
+    for word in range(params.words):
+        name = geom.w_conv % word
+        if word_map is not None and word_map.invert[word]:
+            name = '!' + name
+        if word % 2:
+            cx2 = params.width - Length('200.0 mil')
+            cy = geom.word_y[word][0] - params.drive_pitch / 2.0
+            board.add_text(name, cx2 - Length('50.0 mil'), cy, size=params.drive_pitch, align='center-right', layer=21)
+        else:
+            cx2 = Length('200.0 mil')
+            cy = geom.word_y[word][0] + params.drive_pitch / 2.0
+            board.add_text(name, cx2 + Length('50.0 mil'), cy, size=params.drive_pitch, align='center-left', layer=21)
+
+    board.add_text('+', Length('100.0 mil'), geom.word_y[0][0] - params.drive_pitch, size=params.drive_pitch, align='center', layer=21)
+    board.add_text('-', Length('200.0 mil'), geom.word_y[0][0] - params.drive_pitch, size=params.drive_pitch, align='center', layer=21)
+    board.add_text('-', params.width - Length('200.0 mil'), geom.word_y[0][0] - params.drive_pitch, size=params.drive_pitch, align='center', layer=21)
+    board.add_text('+', params.width - Length('100.0 mil'), geom.word_y[0][0] - params.drive_pitch, size=params.drive_pitch, align='center', layer=21)
+    board.add_text('+', Length('100.0 mil'), geom.word_y[params.words-1][0] + params.drive_pitch, size=params.drive_pitch, align='center', layer=21)
+    board.add_text('-', Length('200.0 mil'), geom.word_y[params.words-1][0] + params.drive_pitch, size=params.drive_pitch, align='center', layer=21)
+    board.add_text('-', params.width - Length('200.0 mil'), geom.word_y[params.words-1][0] + params.drive_pitch, size=params.drive_pitch, align='center', layer=21)
+    board.add_text('+', params.width - Length('100.0 mil'), geom.word_y[params.words-1][0] + params.drive_pitch, size=params.drive_pitch, align='center', layer=21)
+
+    board.add_text(geom.b_conv % 0, geom.bit_x[0][0] + params.sense_pitch, Length('100.0 mil'), size=params.drive_pitch, align='center-left', layer=21)
+    board.add_text(geom.b_conv % (params.bits - 1), geom.bit_x[params.bits - 1][0] - params.sense_pitch, Length('200.0 mil'), size=params.drive_pitch, align='center-right', layer=21)
+    board.add_text(geom.b_conv % 0, geom.bit_x[0][0] + params.sense_pitch, params.length - Length('200.0 mil'), size=params.drive_pitch, align='center-left', layer=21)
+    board.add_text(geom.b_conv % (params.bits - 1), geom.bit_x[params.bits - 1][0] - params.sense_pitch, params.length - Length('100.0 mil'), size=params.drive_pitch, align='center-right', layer=21)
+
+
+def drive_signal(geom, word):
+    params = geom.params
+
+    signal = EagleSignal(geom.w_conv % word, compact = True, lean = True)
+    wires, vias = geom.drive_line(word)
+    signal.add_wires(wires, layer=params.drive_layer, width=params.trace_width)
+    for x, y in vias:
+        signal.add_via(x, y, drill = params.pad_drill)
+    return signal
+
+
+def sense_signal(data, geom, bit):
+    params = geom.params
+
+    signal = EagleSignal(geom.b_conv % bit, compact = True, lean = True)
+    cx, cy1, cy2 = geom.sense_pads(bit)
+    column = data.column(bit)
+
+    signal.add_via(cx, cy1, drill = params.pad_drill)
+    signal.add_wires(geom.sense_loop_segments(bit, column), layer=params.sense_layer, width=params.trace_width)
+    signal.add_via(cx, cy2, drill = params.pad_drill)
+    return signal
+
+
+# Generate the drive line and sense loop signals.
+def generate_signals(data, geom):
+    for word in range(geom.params.words):
+        yield drive_signal(geom, word)
+    for bit in range(geom.params.bits):
+        yield sense_signal(data, geom, bit)
+
+
+# Embed the design rules given by params in a board, if any.
+def add_design_rules(board, params):
+    if params.rules is not None:
+        board.set_design_rules(params.rules)
+
+
+def build_board(data, geom, word_map = None):
+    board = EagleBoardFile(numlayers = 4, lean = True)
+    add_design_rules(board, geom.params)
+    add_plain(board, geom, word_map)
+    for signal in generate_signals(data, geom):
+        board.append_signal(signal)
+    geom.log_wire_counts()
+    return board
+
+
+def generate_board(data, params = RomParams(), word_map = None):
+    data, word_map = arrange_rom_data(data, params, word_map)
+    return build_board(data, RomGeometry(params), word_map)
+
+
+# Generate a board and write it to outfile.  If stream is true, each
+# signal is written as it is generated rather than building the whole
+# board in memory first.  If map_file is given, the word map is written
+# to it.  If workers is greater than one, the signals are serialized by
+# that many worker processes.
+def write_board(data, outfile, params = RomParams(), stream = False, map_file = None, workers = None):
+    data, word_map = arrange_rom_data(data, params)
+    geom = RomGeometry(params)
+    if map_file is not None:
+        word_map.write(map_file, geom)
+    if not stream:
+        build_board(data, geom, word_map).write(outfile, workers = workers)
+        return
+
+    board = EagleBoardFile(numlayers = 4, lean = True)
+    add_design_rules(board, params)
+    add_plain(board, geom, word_map)
+    board.write(outfile, signals = generate_signals(data, geom), workers = workers)
+    geom.log_wire_counts()
+
+
+# Move signals to origin, renaming any whose names are in used, which is
+# updated with the names of the signals.
+def place_signals(signals, origin, used):
+    for signal in signals:
+        name = signal.get_name()
+        if name in used:
+            n = 1
+            while '%s_%d' % (name, n) in used:
+                n += 1
+            name = '%s_%d' % (name, n)
+            signal.set_name(name)
+        used.add(name)
+        signal.translate(*origin)
+        yield signal
+
+
+# Generate a ROM array and merge it into an existing board, such as a
+# carrier board with connectors and drivers, with the lower left corner
+# of the array at origin, writing the result to outfile.  The template is
+# read with EagleBoardFile.load(), the labels are added to its plain
+# section without a board outline, and the signals are added to its
+# signals section as they are written, renamed if the template already
+# has signals of the same names.
+def merge_board(data, template, outfile, params = RomParams(), origin = (0, 0), map_file = None, workers = None):
+    data, word_map = arrange_rom_data(data, params)
+    geom = RomGeometry(params)
+    if map_file is not None:
+        word_map.write(map_file, geom)
+
+    board = EagleBoardFile.load(template, lean = True)
+    add_design_rules(board, params)
+    labels = EagleBoardFile(lean = True)
+    add_plain(labels, geom, word_map, outline = False)
+    for element in list(labels.board.plain.get_element()):
+        translate_element(element, *origin)
+        board.board.plain.add_subelement(element)
+
+    used = { signal.get_name() for signal in board.board.signals.primitives }
+    board.write(outfile, signals = place_signals(generate_signals(data, geom), origin, used), workers = workers)
+    geom.log_wire_counts()
+
+
+# Drive lines of a board labelled as having reversed polarity by
+# add_plain().
+def inverted_drive_lines(board, geom):
+    names = { '!' + geom.w_conv % word: word for word in range(geom.params.words) }
+    return sorted(names[child.text] for child in board.board.plain.get_element()
+                  if child.tag == 'text' and child.text in names)
+
+
+# Update a board previously generated from old_data for new_data,
+# regenerating only the sense loops of bit positions that changed.
+# Everything else in the previous board, including any edits made to it
+# since it was generated, is kept as is.  The previous board's word map
+# must be given if it was not the identity.
+def regenerate_board(old_data, old_board, new_data, params = RomParams(), word_map = None):
+    if (params.optimize_word_order or params.invert_words) and word_map is None:
+        raise ValueError('incremental regeneration needs the word map of the previous board')
+    if word_map is not None and len(word_map.order) != params.words:
+        raise ValueError('word map has %d drive lines, should be %d' % (len(word_map.order), params.words))
+    old_data, word_map = arrange_rom_data(old_data, params, word_map)
+    new_data, word_map = arrange_rom_data(new_data, params, word_map)
+    geom = RomGeometry(params)
+
+    board = EagleBoardFile.load(old_board, lean = True)
+    inverted = inverted_drive_lines(board, geom)
+    if inverted != [line for line, invert in enumerate(word_map.invert) if invert]:
+        if not any(word_map.invert):
+            raise ValueError('the previous board has reversed drive lines, so its word map must be given')
+        raise ValueError('the reversed drive lines of the previous board do not match the word map')
+    add_design_rules(board, params)
+    for bit in old_data.changed_columns(new_data):
+        board.replace_signal(sense_signal(new_data, geom, bit))
+    geom.log_wire_counts()
+    return board
+
+
+# Coordinates within this distance, in mm, are taken to be the same when
+# decoding a board.
+decode_tolerance = 0.001
+
+# Decode the data a board encodes from the geometry of its sense loops.
+# Within the coupling region of each drive line, a sense loop runs
+# vertically on the true side of its bit position for a one, and on the
+# complement side for a zero.  Each vertical sense loop wire is mapped
+# onto the regular grid of drive lines arithmetically, so the time taken
+# is proportional to the number of wires plus the number of bits, rather
+# than testing wires against each other.  origin is the position of the
+# lower left corner of the array on the board, as for merge_board().
+# Since merge_board() renames signals such as B00 to B00_1 if the
+# template already has them, the sense loop of a bit is the signal of
+# either form of its name with a via at the position of the loop's pad.
+#
+# Returns the data as a BitMatrix in drive line order, and a list of
+# (drive line, bit) positions which could not be decoded, because the
+# coupling region of the drive line is crossed on both sides or neither.
+def decode_board(board, params = RomParams(), origin = (0, 0)):
+    geom = RomGeometry(params)
+    words = params.words
+    bits = params.bits
+    ox, oy = origin
+    tol = decode_tolerance
+    y0 = geom.word_y[0][0] + oy
+    half = (geom.sense_y_top[0] - geom.sense_y_bottom[0]) / 2.0
+    pitch = params.drive_pitch
+
+    candidates = { }
+    for signal in board.board.signals.primitives:
+        name = re.sub(r'_\d+$', '', signal.get_name())
+        candidates.setdefault(name, []).append(signal)
+
+    def sense_loop(bit):
+        cx, cy1, cy2 = geom.sense_pads(bit)
+        for signal in candidates.get(geom.b_conv % bit, ()):
+            for x, y, drill, diameter, extent, shape in signal.vias():
+                if abs(x - cx - ox) <= tol and abs(y - cy1 - oy) <= tol:
+                    return signal
+        return None
+
+    cells = bytearray(words * bits)
+    undecoded = []
+    for bit in range(bits):
+        # crossed[0] and crossed[1] are the drive lines crossed on the
+        # complement and true sides.
+        crossed = (bytearray(words), bytearray(words))
+        signal = sense_loop(bit)
+        if signal is not None:
+            sides = ((geom.bit_x[bit][2] + ox, crossed[0]),
+                     (geom.bit_x[bit][1] + ox, crossed[1]))
+            for x1, y1, x2, y2, layer, width in signal.wires():
+                if layer != params.sense_layer or abs(x1 - x2) > tol:
+                    continue
+                for x, lines in sides:
+                    if abs(x1 - x) <= tol:
+                        # Drive lines whose coupling region lies within
+                        # the wire.
+                        first = max(0, math.ceil((min(y1, y2) - tol - y0 + half) / pitch))
+                        last = min(words - 1, math.floor((max(y1, y2) + tol - y0 - half) / pitch))
+                        for line in range(first, last + 1):
+                            lines[line] = 1
+        for line in range(words):
+            if crossed[0][line] == crossed[1][line]:
+                undecoded.append((line, bit))
+            else:
+                cells[line * bits + bit] = crossed[1][line]
+    return BitMatrix(words, bits, bytes(cells)), undecoded
+
+
+# Compare the data a board encodes with a ROM image, which is arranged
+# by word_map as when the board was generated.  Returns a list of
+# descriptions of the differences, by word address and bit.
+def verify_board(board, data, params = RomParams(), word_map = None, origin = (0, 0)):
+    data, word_map = arrange_rom_data(data, params, word_map or WordMap.identity(params.words))
+    decoded, undecoded = decode_board(board, params, origin)
+    problems = ['word %d bit %d: not decodable from drive line %d' % (word_map.order[line], bit, line)
+                for line, bit in undecoded]
+    undecoded = set(undecoded)
+    for bit in decoded.changed_columns(data):
+        for line, (board_bit, image_bit) in enumerate(zip(decoded.column(bit), data.column(bit))):
+            if board_bit != image_bit and (line, bit) not in undecoded:
+                invert = word_map.invert[line]
+                problems.append('word %d bit %d: board has %d, image has %d' %
+                                (word_map.order[line], bit, board_bit ^ invert, image_bit ^ invert))
+    return problems
+
+
+# Generate a board file from a ROM image file, and its word map file if
+# the word order or polarity is optimized.  The output is compressed if
+# its name ends with .gz or .xz.  If generation fails, the partly written
+# files are removed, so that they can't be mistaken for good ones.
+def build_board_file(input_path, output_path, params = RomParams(), stream = False):
+    with open(input_path, 'rb') as f:
+        data = f.read()
+    map_path = None
+    if params.optimize_word_order or params.invert_words:
+        map_path = default_map_path(output_path)
+    try:
+        with open_board_file(output_path, 'wb') as f:
+            if map_path is not None:
+                with open(map_path, 'w') as map_file:
+                    write_board(data, f, params, stream = stream, map_file = map_file)
+            else:
+                write_board(data, f, params, stream = stream)
+    except BaseException:
+        for path in (output_path, map_path):
+            if path is not None and os.path.exists(path):
+                os.remove(path)
+        raise
+    return output_path
+
+
+def default_output_path(input_path):
+    return os.path.splitext(input_path)[0] + '.brd'
+
+
+# The word map of an optimized board is written alongside it, with the
+# board's name but the suffix .map.
+def default_map_path(output_path):
+    if compression(output_path) is not None:
+        output_path = os.path.splitext(output_path)[0]
+    return os.path.splitext(output_path)[0] + '.map'
+
+
+# A batch manifest is a JSON list of objects, each with an "input" ROM
+# image path, an optional "output" board path, and optionally any
+# RomParams field names overriding the base parameters for that image.
+# Relative paths are relative to the directory containing the manifest.
+#
+# Returns a list of (input_path, output_path, params) jobs for the valid
+# entries, and a list of (input_path, output_path, exception) for the
+# invalid ones, as run_batch() reports failures, so that a bad entry
+# fails only its own image.  An entry without a usable input path is
+# identified by its position in the manifest instead.
+def read_batch_manifest(path, params = RomParams()):
+    with open(path, 'r') as f:
+        manifest = json.load(f)
+    if not isinstance(manifest, list):
+        raise ValueError('%s: batch manifest must be a JSON list' % path)
+    base_dir = os.path.dirname(path)
+    jobs = []
+    failures = []
+    for index, entry in enumerate(manifest):
+        input_path = '%s entry %d' % (path, index)
+        output_path = None
+        try:
+            if not isinstance(entry, dict):
+                raise ValueError('manifest entry must be a JSON object')
+            entry = dict(entry)
+            if not isinstance(entry.get('input'), str):
+                raise ValueError('manifest entry has no "input" ROM image path')
+            input_path = os.path.join(base_dir, entry.pop('input'))
+            if 'output' in entry:
+                if not isinstance(entry['output'], str):
+                    raise ValueError('"output" must be a board path')
+                output_path = os.path.join(base_dir, entry.pop('output'))
+            else:
+                output_path = default_output_path(input_path)
+            if isinstance(entry.get('rules'), str):
+                entry['rules'] = os.path.join(base_dir, entry['rules'])
+            jobs.append((input_path, output_path, params.override(**entry)))
+        except (TypeError, ValueError) as e:
+            failures.append((input_path, output_path, e))
+    return jobs, failures
+
+
+def glob_batch(pattern, params = RomParams()):
+    return [(input_path, default_output_path(input_path), params)
+            for input_path in sorted(glob.glob(pattern))]
+
+
+# Generate each (input_path, output_path, params) job in a process pool.
+# Returns a list of (input_path, output_path, exception) in job order,
+# with exception None for images that were generated successfully.
+def run_batch(jobs, workers = None, stream = False):
+    results = []
+    with concurrent.futures.ProcessPoolExecutor(max_workers = workers) as executor:
+        futures = [executor.submit(build_board_file, input_path, output_path, params, stream)
+                   for input_path, output_path, params in jobs]
+        for (input_path, output_path, params), future in zip(jobs, futures):
+            try:
+                future.result()
+                results.append((input_path, output_path, None))
+            except Exception as e:
+                results.append((input_path, output_path, e))
+    return results